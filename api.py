@@ -1,28 +1,323 @@
 # backend/api.py
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+import numpy as np
 import pandas as pd
 import json
-import os
+import threading
 import backend.config as config
+from backend.fused_store import FusedStore, parse_bbox
+from backend.hotspots import HotspotGrid
+from backend.jobs import JobQueue
+from backend.nearest import PointLookup
+from backend.plume import plume_trajectories
+from backend.response_cache import ResponseCache, file_version, read_bytes
+from backend.signature import attach_signatures
+from backend.stats import StatsAccumulator
+from backend.tile_pyramid import TilePyramid, pyramid_path, raw_tile
+from backend.timeseries import TimeSeriesStore
 
 
 app = Flask(__name__)
+cache = ResponseCache()
+tile_cache = ResponseCache(max_entries=4096)
+predict_cache = ResponseCache(max_entries=config.PREDICT_CACHE_SIZE)
+query_cache = ResponseCache(max_entries=config.QUERY_CACHE_SIZE)
+jobs = JobQueue(max_workers=config.PREDICT_WORKERS)
+store = FusedStore()
+
+_pyramid = None
+_pyramid_lock = threading.Lock()
+_lookup = None
+_lookup_lock = threading.Lock()
+_series = None
+_series_lock = threading.Lock()
+
+
+def current_pyramid():
+    """Tile pyramid written by fusion, reloaded when its file changes (never built here)."""
+    global _pyramid
+    pyramid = _pyramid
+    if pyramid is None or pyramid.version != file_version(pyramid_path()):
+        pyramid = TilePyramid.cached()
+        with _pyramid_lock:
+            _pyramid = pyramid
+    return pyramid
+
+
+def current_lookup(version):
+    """Point lookup index for the given store version, rebuilt when the store changes."""
+    global _lookup
+    with _lookup_lock:
+        if _lookup is None or _lookup.version != version:
+            _lookup = PointLookup.from_store(store)
+        return _lookup
+
+
+def current_series():
+    """Time-series store; fusion keeps it current, so requests only read its chunks."""
+    global _series
+    with _series_lock:
+        if _series is None:
+            _series = TimeSeriesStore()
+        return _series
+
+
+def _etag_matches(etag):
+    header = request.headers.get("If-None-Match", "")
+    if header.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in tags
+
+
+def send_cached(entry):
+    """Serve a CachedPayload: 304 on a matching ETag, else the best precompressed body."""
+    headers = {"ETag": entry.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if _etag_matches(entry.etag):
+        return Response(status=304, headers=headers)
+    encoding, body = entry.negotiate(request.headers.get("Accept-Encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=entry.mimetype, headers=headers)
+
 
 @app.route("/api/data")
 def get_data():
-    """Return fused anomaly + signature dataset."""
-    if not os.path.exists(config.DATA_PATH):
+    """Return fused anomaly + signature dataset (cached until the file changes)."""
+    version = file_version(config.DATA_PATH)
+    if version is None:
         return jsonify({"error": "Fused data not found"}), 404
-    with open(config.DATA_PATH, "r") as f:
-        data = json.load(f)
-    return jsonify(data)
+    entry = cache.get("data", version, lambda: read_bytes(config.DATA_PATH))
+    return send_cached(entry)
+
+@app.route("/api/tiles/<int:z>/<int:x>/<int:y>")
+def get_tile(z, x, y):
+    """Binned NO2/anomaly aggregates for one XYZ tile; raw pixels above TILE_MAX_ZOOM."""
+    if z < 0 or z > 22 or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return jsonify({"error": "Tile out of range"}), 400
+    # Binned tiles follow the pyramid file, raw tiles the store
+    pyramid = current_pyramid() if z <= config.TILE_MAX_ZOOM else None
+    version = ("binned", pyramid.version) if pyramid is not None else store.version()
+
+    def build():
+        body = {"z": z, "x": x, "y": y}
+        if pyramid is not None:
+            body["level"] = "binned"
+            body["bins"] = pyramid.tile(z, x, y)
+        else:
+            body["level"] = "raw"
+            body["points"], body["truncated"] = raw_tile(store, z, x, y)
+        return json.dumps(body, separators=(",", ":")).encode()
+
+    return send_cached(tile_cache.get(f"{z}/{x}/{y}", version, build))
+
+@app.route("/api/stats")
+def get_stats():
+    """One-pass summary of the fused store (cached per store version)."""
+    version = store.version()
+
+    def build():
+        summary = StatsAccumulator.from_store(store).result()
+        return json.dumps(summary, separators=(",", ":")).encode()
+
+    return send_cached(cache.get("stats", version, build))
+
+@app.route("/api/hotspots")
+def get_hotspots():
+    """Connected anomaly clusters (?bbox=w,s,e,n&start=&end=&limit=&min_pixels=), largest peak first."""
+    try:
+        params = {
+            "bbox": parse_bbox(request.args.get("bbox")),
+            "start": request.args.get("start"),
+            "end": request.args.get("end"),
+            "limit": int(request.args.get("limit", 100)),
+            "min_pixels": int(request.args.get("min_pixels", config.HOTSPOT_MIN_PIXELS)),
+        }
+        for key in ("start", "end"):
+            if params[key] is not None:
+                params[key] = pd.Timestamp(params[key]).isoformat()
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad parameters: {e}"}), 400
+    version = store.version()
+
+    def build():
+        grid = HotspotGrid.from_store(store, bbox=params["bbox"], start=params["start"], end=params["end"])
+        clusters = grid.clusters(params["min_pixels"])
+        body = {"count": len(clusters), "hotspots": clusters[:max(params["limit"], 0)]}
+        return json.dumps(body, separators=(",", ":")).encode()
+
+    key = "hotspots:" + json.dumps(params, sort_keys=True)
+    return send_cached(query_cache.get(key, version, build))
+
+def _nearest_params():
+    """Points + options from a JSON body or the query string (points=lat,lon;lat,lon)."""
+    body = request.get_json(silent=True) or {}
+    args = {**request.args.to_dict(), **body}
+    points = args.get("points")
+    if isinstance(points, str):
+        points = [p.split(",") for p in points.split(";") if p.strip()]
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 2 or not len(points):
+        raise ValueError("points must be a list of [lat, lon] pairs")
+    if len(points) > config.NEAREST_MAX_POINTS:
+        raise ValueError(f"at most {config.NEAREST_MAX_POINTS} points per request")
+    if not (np.all(np.abs(points[:, 0]) <= 90) and np.all(np.abs(points[:, 1]) <= 360)):
+        raise ValueError("lat must be in [-90, 90] and lon in [-360, 360]")
+    params = {"points": points, "k": int(args.get("k", 1)),
+              "radius_km": args.get("radius_km"), "max_km": float(args.get("max_km", np.inf))}
+    if not 1 <= params["k"] <= config.NEAREST_MAX_K:
+        raise ValueError(f"k must be in [1, {config.NEAREST_MAX_K}]")
+    if params["radius_km"] is not None:
+        params["radius_km"] = float(params["radius_km"])
+        if not 0 < params["radius_km"] <= 500:
+            raise ValueError("radius_km must be in (0, 500]")
+    return params
+
+
+@app.route("/api/nearest", methods=["GET", "POST"])
+def get_nearest():
+    """Fused values at many points: k nearest pixels (?k=&max_km=) or all within ?radius_km=.
+
+    Points come as ?points=lat,lon;lat,lon or a JSON body {"points": [[lat, lon], ...]}.
+    """
+    try:
+        params = _nearest_params()
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad parameters: {e}"}), 400
+    lookup = current_lookup(store.version())
+    if not len(lookup):
+        return jsonify({"error": "No fused data indexed"}), 404
+    lat, lon = params["points"][:, 0], params["points"][:, 1]
+
+    if params["radius_km"] is not None:
+        point_ids, records = lookup.within(lat, lon, params["radius_km"], limit=config.NEAREST_MAX_MATCHES)
+        columns = {col: PointLookup.jsonable(values) for col, values in records.items()}
+        results = [{"lat": float(a), "lon": float(b), "matches": []} for a, b in zip(lat, lon)]
+        for i, pid in enumerate(point_ids.tolist()):
+            results[pid]["matches"].append({col: values[i] for col, values in columns.items()})
+        return jsonify({"mode": "radius", "radius_km": params["radius_km"], "results": results})
+
+    records = lookup.nearest(lat, lon, k=params["k"], max_km=params["max_km"])
+    found = records.pop("found")
+    columns = {col: PointLookup.jsonable(values) for col, values in records.items()}
+    results = []
+    for i in range(len(lat)):
+        matches = [{col: values[i][j] for col, values in columns.items()}
+                   for j in range(found.shape[1]) if found[i, j]]
+        results.append({"lat": float(lat[i]), "lon": float(lon[i]), "matches": matches})
+    return jsonify({"mode": "nearest", "k": params["k"], "results": results})
+
+@app.route("/api/timeseries")
+def get_timeseries():
+    """NO2 history of the grid cell containing ?lat=&lon= between ?start= and ?end= (UTC)."""
+    try:
+        lat, lon = float(request.args["lat"]), float(request.args["lon"])
+        end = pd.Timestamp(request.args["end"]) if "end" in request.args else pd.Timestamp.now("UTC")
+        end = end.tz_convert(None) if end.tzinfo else end
+        start = pd.Timestamp(request.args["start"]) if "start" in request.args else end - pd.Timedelta(days=1)
+        start = start.tz_convert(None) if start.tzinfo else start
+        if not start <= end:
+            raise ValueError("start must not be after end")
+        if end - start > pd.Timedelta(days=config.TS_MAX_DAYS):
+            raise ValueError(f"range is limited to {config.TS_MAX_DAYS} days")
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad parameters: {e}"}), 400
+    series = current_series()
+    bounds = series.cell_bounds(lat, lon)
+    if bounds is None:
+        return jsonify({"error": "Point outside the time-series grid"}), 404
+    df = series.series(lat, lon, start=start, end=end)
+    return jsonify({
+        "lat": lat, "lon": lon, "cell": bounds,
+        "start": start.isoformat(), "end": end.isoformat(),
+        "series": [
+            {"time": t.strftime("%Y-%m-%dT%H:%M:%SZ"), "pixels": int(p), "no2_mean": float(m),
+             "no2_max": float(x), "anomalies": int(a)}
+            for t, p, m, x, a in zip(df["time"], df["pixels"], df["no2_mean"], df["no2_max"], df["anomalies"])
+        ],
+    })
+
+def _predict_params(args):
+    params = {
+        "hours": float(args.get("hours", config.DEFAULT_HOURS)),
+        "dt": float(args.get("dt", config.TIME_STEP_MIN)),
+        "seed": int(args.get("seed", 0)),
+        "members": int(args.get("members", 1)),
+        "bbox": parse_bbox(args.get("bbox")),
+    }
+    if not 0 < params["hours"] <= config.PREDICT_MAX_HOURS:
+        raise ValueError(f"hours must be in (0, {config.PREDICT_MAX_HOURS}]")
+    if not 1 <= params["dt"] <= params["hours"] * 60:
+        raise ValueError("dt must be between 1 minute and the forecast length")
+    if not 1 <= params["members"] <= config.PREDICT_MAX_MEMBERS:
+        raise ValueError(f"members must be in [1, {config.PREDICT_MAX_MEMBERS}]")
+    return params
+
+
+def forecast_sources(bbox):
+    """(newest granule time, anomaly count there within bbox) -- what a forecast starts from."""
+    latest = store.latest_time()
+    if latest is None:
+        return None, 0
+    df = store.read(columns=[config.ANOM_COL], bbox=bbox, start=latest, end=latest)
+    return latest, int((df[config.ANOM_COL] == 1).sum())
+
+
+def forecast(params, latest):
+    """Plume paths from the anomalies of the newest granule (within bbox), serialized to JSON."""
+    cols = [config.LAT_COL, config.LON_COL, config.NO2_COL, config.T2M_COL, config.QV2M_COL,
+            config.PS_COL, config.ANOM_COL]
+    df = store.read(columns=cols, bbox=params["bbox"], start=latest, end=latest) \
+        if latest is not None else pd.DataFrame(columns=cols)
+    df = df[df[config.ANOM_COL] == 1].reset_index(drop=True)
+    paths = plume_trajectories(attach_signatures(df), hours=params["hours"], dt_minutes=params["dt"],
+                               members=params["members"], seed=params["seed"],
+                               start=None if latest is None else latest.to_pydatetime())
+    return json.dumps(paths, separators=(",", ":")).encode()
+
 
 @app.route("/api/predict")
 def predict():
-    """Placeholder for plume prediction (calls plume.py later)."""
-    from plume import simulate_plume
-    results = simulate_plume()
-    return jsonify(results)
+    """Plume forecast (?hours=&dt=&seed=&members=&bbox=w,s,e,n).
+
+    Served from the LRU cache when possible; otherwise runs as a background job and
+    answers inline if it finishes within PREDICT_SYNC_WAIT_S, else 202 with a job id.
+    """
+    try:
+        params = _predict_params(request.args)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad parameters: {e}"}), 400
+    version = store.version()
+    key = json.dumps(params, sort_keys=True)
+    entry = predict_cache.peek(key, version)
+    if entry is not None:
+        return send_cached(entry)
+
+    latest, sources = forecast_sources(params["bbox"])
+    points = sources * params["members"] * (int(params["hours"] * 60 / params["dt"]) + 1)
+    if points > config.PREDICT_MAX_PATH_POINTS:
+        return jsonify({"error": f"Forecast too large ({points:,} path points); "
+                                 "narrow bbox or raise dt"}), 400
+    job = jobs.submit((key, version),
+                      lambda: predict_cache.get(key, version, lambda: forecast(params, latest)))
+    if jobs.wait(job, config.PREDICT_SYNC_WAIT_S) and job["status"] == "done":
+        return send_cached(job["result"])
+    return predict_job(job["id"])
+
+
+@app.route("/api/predict/jobs/<job_id>")
+def predict_job(job_id):
+    """Poll a background forecast: 202 while running, the forecast once done."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] == "done":
+        return send_cached(job["result"])
+    status = JobQueue.describe(job)
+    if job["status"] == "error":
+        return jsonify(status), 500
+    status["poll"] = f"/api/predict/jobs/{job_id}"
+    return jsonify(status), 202
 
 if __name__ == "__main__":
     app.run(host=config.HOST, port=config.PORT, debug=True)
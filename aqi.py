@@ -0,0 +1,141 @@
+# aqi.py
+# --------------------------------------------
+# Vectorized US EPA Air Quality Index for ADIS
+# Piecewise-linear breakpoint tables per pollutant, evaluated for whole
+# arrays with one searchsorted each. Categories and colours are array
+# lookups, and category counts come from a single bincount.
+#   NO2    1-hour, ppb (TEMPO columns go through a surface proxy first)
+#   O3     8-hour, ppm (up to 0.200 ppm / AQI 300)
+#   O3_1H  1-hour, ppm (from 0.125 ppm; the only O3 scale above AQI 300)
+#   PM2.5  24-hour, µg/m³ (2024 revision)
+# --------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+from backend.utils import no2_column_to_ppb
+
+# (C_lo, C_hi, I_lo, I_hi) rows in ascending order
+BREAKPOINTS = {
+    "no2": np.array([
+        [0, 53, 0, 50],
+        [54, 100, 51, 100],
+        [101, 360, 101, 150],
+        [361, 649, 151, 200],
+        [650, 1249, 201, 300],
+        [1250, 2049, 301, 500],
+    ], dtype=float),
+    "o3": np.array([
+        [0.000, 0.054, 0, 50],
+        [0.055, 0.070, 51, 100],
+        [0.071, 0.085, 101, 150],
+        [0.086, 0.105, 151, 200],
+        [0.106, 0.200, 201, 300],
+    ]),
+    "o3_1h": np.array([
+        [0.125, 0.164, 101, 150],
+        [0.165, 0.204, 151, 200],
+        [0.205, 0.404, 201, 300],
+        [0.405, 0.604, 301, 500],
+    ]),
+    "pm25": np.array([
+        [0.0, 9.0, 0, 50],
+        [9.1, 35.4, 51, 100],
+        [35.5, 55.4, 101, 150],
+        [55.5, 125.4, 151, 200],
+        [125.5, 225.4, 201, 300],
+        [225.5, 325.4, 301, 500],
+    ]),
+}
+# Concentrations are truncated to the table's precision before lookup
+DECIMALS = {"no2": 0, "o3": 3, "o3_1h": 3, "pm25": 1}
+# AQI above a table's last breakpoint: 500, or NaN where the table is not
+# defined there (8-hour O3 above 0.200 ppm must use the 1-hour table)
+ABOVE_TABLE = {"o3": np.nan}
+
+# Reported unit -> factor into the table's unit (gases at 25 °C, 1 atm)
+UNIT_FACTORS = {
+    "no2": {"ppb": 1.0, "ppm": 1000.0, "µg/m³": 1 / 1.88, "ug/m3": 1 / 1.88},
+    "o3": {"ppm": 1.0, "ppb": 1e-3, "µg/m³": 1 / 1960.0, "ug/m3": 1 / 1960.0},
+    "o3_1h": {"ppm": 1.0, "ppb": 1e-3, "µg/m³": 1 / 1960.0, "ug/m3": 1 / 1960.0},
+    "pm25": {"µg/m³": 1.0, "ug/m3": 1.0},
+}
+
+# Category upper bounds, names and colours (RGBA)
+CATEGORY_BREAKS = np.array([50, 100, 150, 200, 300], dtype=float)
+CATEGORIES = ["Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy",
+              "Very Unhealthy", "Hazardous"]
+COLORS = np.array([
+    [0, 228, 0, 255],
+    [255, 255, 0, 255],
+    [255, 126, 0, 255],
+    [255, 0, 0, 255],
+    [143, 63, 151, 255],
+    [126, 0, 35, 255],
+], dtype=np.uint8)
+
+
+def aqi_from_concentration(pollutant, conc):
+    """AQI for an array of concentrations in the table's unit.
+
+    NaN stays NaN; values below the table (1-hour O3 under 0.125 ppm) are NaN, values
+    above it are ABOVE_TABLE (default 500).
+    """
+    table = BREAKPOINTS[pollutant]
+    c = np.asarray(conc, dtype=float)
+    scale = 10.0 ** DECIMALS[pollutant]
+    c = np.floor(np.maximum(c, 0.0) * scale + 1e-9) / scale
+    idx = np.minimum(np.searchsorted(table[:, 1], c, side="left"), len(table) - 1)
+    c_lo, c_hi, i_lo, i_hi = table[idx].T
+    aqi = np.round((i_hi - i_lo) / (c_hi - c_lo) * (np.clip(c, c_lo, c_hi) - c_lo) + i_lo)
+    aqi = np.where(c > table[-1, 1], ABOVE_TABLE.get(pollutant, 500.0), aqi)
+    return np.where(np.isfinite(c) & (c >= table[0, 0]), aqi, np.nan)
+
+
+def aqi_from_no2_column(column, pbl_height_m=None):
+    """AQI from TEMPO NO2 columns (molecules/cm²) via the well-mixed surface ppb proxy."""
+    return aqi_from_concentration("no2", no2_column_to_ppb(column, pbl_height_m))
+
+
+def aqi_for_parameter(parameter, values, units=None):
+    """AQI for OpenAQ readings of one parameter; units (scalar or array) default to the table's."""
+    parameter = str(parameter).lower().replace(".", "")
+    values = np.asarray(values, dtype=float)
+    if units is not None:
+        factors = pd.Series(np.broadcast_to(units, values.shape)).map(UNIT_FACTORS[parameter])
+        values = values * factors.to_numpy(dtype=float)
+    return aqi_from_concentration(parameter, values)
+
+
+def readings_aqi(long_df):
+    """AQI per row of an OpenAQ long-format table (NaN for parameters without a table)."""
+    out = np.full(len(long_df), np.nan)
+    params = long_df["parameter"].astype(str).str.lower().str.replace(".", "", regex=False)
+    for pollutant in BREAKPOINTS:
+        rows = np.flatnonzero((params == pollutant).to_numpy())
+        if len(rows):
+            sub = long_df.iloc[rows]
+            units = sub["unit"].to_numpy() if "unit" in sub else None
+            out[rows] = aqi_for_parameter(pollutant, pd.to_numeric(sub["value"], errors="coerce"), units)
+    return out
+
+
+def categories(aqi):
+    """Category index (0 = Good ... 5 = Hazardous) per AQI value; -1 where NaN."""
+    aqi = np.asarray(aqi, dtype=float)
+    idx = np.searchsorted(CATEGORY_BREAKS, np.nan_to_num(aqi), side="left")
+    return np.where(np.isfinite(aqi), idx, -1)
+
+
+def colors(aqi, missing=(0, 0, 0, 0)):
+    """(..., 4) uint8 RGBA per AQI value; `missing` where NaN."""
+    idx = categories(aqi)
+    rgba = COLORS[np.maximum(idx, 0)]
+    rgba[idx < 0] = missing
+    return rgba
+
+
+def category_counts(aqi):
+    """Points per category in one bincount pass (NaN ignored)."""
+    idx = categories(aqi).ravel()
+    return np.bincount(idx[idx >= 0], minlength=len(CATEGORIES))
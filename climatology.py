@@ -0,0 +1,266 @@
+# climatology.py
+# --------------------------------------------
+# Persistent per-cell NO2 climatology for ADIS
+# Running count / mean / M2 (Welford) per CLIM_CELL_DEG cell over the
+# CLIM_BOUNDS domain, kept as memory-mapped .npy arrays. Each granule is
+# reduced to per-cell moments first and merged in with Chan's parallel
+# update. Those per-granule moments are kept on disk, so re-fusing a
+# granule subtracts its old contribution before adding the new one and
+# reruns never double-count. Each update first journals the old values of
+# the cells it touches; the ledger save is the commit point, and an update
+# interrupted before it is rolled back on the next open.
+# --------------------------------------------
+
+import json
+import os
+import uuid
+
+import numpy as np
+
+import backend.config as config
+
+LEDGER_FILE = "ledger.json"
+JOURNAL_FILE = "journal.npz"
+
+
+def reduce_moments(ids, n, mean, m2):
+    """Combine (n, mean, M2) rows that share a cell id. Returns key-sorted arrays."""
+    uniq, inv = np.unique(ids, return_inverse=True)
+    k = len(uniq)
+    tot_n = np.bincount(inv, weights=n, minlength=k)
+    tot_mean = np.bincount(inv, weights=n * mean, minlength=k) / np.maximum(tot_n, 1)
+    tot_m2 = np.bincount(inv, weights=m2 + n * (mean - tot_mean[inv]) ** 2, minlength=k)
+    return uniq, tot_n.astype(np.int64), tot_mean, tot_m2
+
+
+class CellGrid:
+    """Flat cell ids on a regular lat/lon grid over (west, south, east, north)."""
+
+    def __init__(self, cell_deg=None, bounds=None):
+        self.cell_deg = cell_deg or config.CLIM_CELL_DEG
+        self.bounds = tuple(bounds or config.CLIM_BOUNDS)
+        west, south, east, north = self.bounds
+        self.nrows = int(np.ceil((north - south) / self.cell_deg))
+        self.ncols = int(np.ceil((east - west) / self.cell_deg))
+
+    @property
+    def size(self):
+        return self.nrows * self.ncols
+
+    def cell_ids(self, lat, lon):
+        """Cell id per point, -1 outside the domain."""
+        west, south, _, _ = self.bounds
+        row = np.floor((np.asarray(lat, dtype=float) - south) / self.cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon, dtype=float) - west) / self.cell_deg).astype(np.int64)
+        ok = (row >= 0) & (row < self.nrows) & (col >= 0) & (col < self.ncols)
+        return np.where(ok, row * self.ncols + col, -1)
+
+
+class GranuleCells:
+    """Per-cell NO2 moments of one granule, accumulated chunk by chunk."""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self._parts = []
+        self.pixels = 0
+
+    @classmethod
+    def from_moments(cls, grid, moments, pixels):
+        """Rebuild from (ids, n, mean, M2), e.g. as returned by a worker process."""
+        cells = cls(grid)
+        if len(moments[0]):
+            cells._parts.append(tuple(moments))
+        cells.pixels = pixels
+        return cells
+
+    def add(self, lat, lon, values):
+        values = np.asarray(values, dtype=np.float64)
+        ids = self.grid.cell_ids(lat, lon)
+        ok = (ids >= 0) & np.isfinite(values)
+        if not ok.any():
+            return self
+        ids, x = ids[ok], values[ok]
+        uniq, inv = np.unique(ids, return_inverse=True)
+        n = np.bincount(inv, minlength=len(uniq))
+        mean = np.bincount(inv, weights=x, minlength=len(uniq)) / n
+        m2 = np.bincount(inv, weights=(x - mean[inv]) ** 2, minlength=len(uniq))
+        self._parts.append((uniq, n, mean, m2))
+        self.pixels += int(ok.sum())
+        return self
+
+    def moments(self):
+        """(ids, n, mean, M2) over everything added so far."""
+        if not self._parts:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        return reduce_moments(*(np.concatenate([p[k] for p in self._parts]) for k in range(4)))
+
+
+class Climatology:
+    """Memory-mapped running per-cell count / mean / M2, updated one granule at a time."""
+
+    def __init__(self, root=None, cell_deg=None, bounds=None, readonly=False):
+        self.root = root or config.CLIMATOLOGY_DIR
+        self.readonly = readonly
+        os.makedirs(os.path.join(self.root, "granules"), exist_ok=True)
+        self.ledger_path = os.path.join(self.root, LEDGER_FILE)
+        self.ledger = self._load_ledger()
+        grid_meta = self.ledger.get("grid")
+        if grid_meta:
+            cell_deg, bounds = grid_meta["cell_deg"], grid_meta["bounds"]
+        self.grid = CellGrid(cell_deg, bounds)
+        self.ledger["grid"] = {"cell_deg": self.grid.cell_deg, "bounds": list(self.grid.bounds)}
+        self.count = self._open("count", np.int64)
+        self.mean = self._open("mean", np.float64)
+        self.m2 = self._open("m2", np.float64)
+        self.journal_path = os.path.join(self.root, JOURNAL_FILE)
+        if not readonly:
+            self._recover()
+
+    def _open(self, name, dtype):
+        path = os.path.join(self.root, f"{name}.npy")
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r" if self.readonly else "r+")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(self.grid.size,))
+
+    def _load_ledger(self):
+        if not os.path.exists(self.ledger_path):
+            return {"granules": {}}
+        with open(self.ledger_path, "r") as f:
+            return json.load(f)
+
+    def _save_ledger(self):
+        tmp = f"{self.ledger_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.ledger, f, indent=2)
+        os.replace(tmp, self.ledger_path)
+
+    def new_granule(self):
+        return GranuleCells(self.grid)
+
+    # === Updates ===
+
+    def _merge(self, ids, n, mean, m2, sign):
+        """Chan's parallel update (sign=+1) or its exact inverse (sign=-1) on cells ids."""
+        n_a = self.count[ids].astype(np.float64)
+        mean_a, m2_a = self.mean[ids], self.m2[ids]
+        n = n.astype(np.float64)
+        if sign > 0:
+            tot = n_a + n
+            delta = mean - mean_a
+            new_mean = mean_a + delta * n / tot
+            new_m2 = m2_a + m2 + delta ** 2 * n_a * n / tot
+        else:
+            tot = n_a - n
+            safe = np.maximum(tot, 1)
+            new_mean = (n_a * mean_a - n * mean) / safe
+            delta = mean - new_mean
+            new_m2 = m2_a - m2 - delta ** 2 * tot * n / np.maximum(n_a, 1)
+            empty = tot <= 0
+            new_mean[empty], new_m2[empty], tot[empty] = 0.0, 0.0, 0
+        self.count[ids] = tot.astype(np.int64)
+        self.mean[ids] = new_mean
+        self.m2[ids] = np.maximum(new_m2, 0.0)
+
+    def apply(self, granule_id, cells, digest=None):
+        """Add a granule's GranuleCells; a no-op if this digest was already applied.
+
+        If the granule was applied before with different content, its old contribution
+        is subtracted first. Returns True when the arrays changed.
+        """
+        seen = self.ledger["granules"].get(granule_id)
+        if seen is not None and digest is not None and seen.get("digest") == digest:
+            return False
+
+        old = self._load_moments(granule_id) if seen is not None else None
+        ids, n, mean, m2 = cells.moments()
+        path = self._granule_path(granule_id)
+        np.savez(f"{path}.new.npz", ids=ids, n=n, mean=mean, m2=m2)
+        token = self._begin(granule_id, "apply", ids if old is None else np.union1d(ids, old[0]))
+        if old is not None:
+            self._merge(*old, -1)
+        self._merge(ids, n, mean, m2, +1)
+        self.flush()
+        self.ledger["granules"][granule_id] = {"digest": digest, "pixels": cells.pixels, "cells": int(len(ids))}
+        self._commit(token)
+        os.replace(f"{path}.new.npz", path)
+        os.remove(self.journal_path)
+        return True
+
+    def remove(self, granule_id):
+        """Subtract a previously applied granule."""
+        if granule_id not in self.ledger["granules"]:
+            return False
+        old = self._load_moments(granule_id)
+        token = self._begin(granule_id, "remove", old[0])
+        self._merge(*old, -1)
+        self.flush()
+        del self.ledger["granules"][granule_id]
+        self._commit(token)
+        os.remove(self._granule_path(granule_id))
+        os.remove(self.journal_path)
+        return True
+
+    def flush(self):
+        for arr in (self.count, self.mean, self.m2):
+            arr.flush()
+
+    # === Journal ===
+
+    def _begin(self, granule_id, op, ids):
+        """Journal the current values of cells ids before they are modified."""
+        token = uuid.uuid4().hex
+        tmp = f"{self.journal_path}.tmp.npz"
+        np.savez(tmp, token=token, granule=granule_id, op=op, ids=ids,
+                 count=self.count[ids], mean=self.mean[ids], m2=self.m2[ids])
+        os.replace(tmp, self.journal_path)
+        return token
+
+    def _commit(self, token):
+        """The ledger save is the commit point of the journaled update."""
+        self.ledger["committed"] = token
+        self._save_ledger()
+
+    def _recover(self):
+        """Finish (ledger saved) or roll back (not saved) an update interrupted by a crash."""
+        if not os.path.exists(self.journal_path):
+            return
+        with np.load(self.journal_path) as j:
+            token, granule_id, op = str(j["token"]), str(j["granule"]), str(j["op"])
+            ids, count, mean, m2 = j["ids"], j["count"], j["mean"], j["m2"]
+        path = self._granule_path(granule_id)
+        if self.ledger.get("committed") == token:
+            if op == "apply" and os.path.exists(f"{path}.new.npz"):
+                os.replace(f"{path}.new.npz", path)
+            elif op == "remove" and os.path.exists(path):
+                os.remove(path)
+        else:
+            self.count[ids], self.mean[ids], self.m2[ids] = count, mean, m2
+            self.flush()
+            if os.path.exists(f"{path}.new.npz"):
+                os.remove(f"{path}.new.npz")
+        os.remove(self.journal_path)
+
+    def _load_moments(self, granule_id):
+        with np.load(self._granule_path(granule_id)) as g:
+            return g["ids"], g["n"], g["mean"], g["m2"]
+
+    def _granule_path(self, granule_id):
+        return os.path.join(self.root, "granules", f"{granule_id}.npz")
+
+    # === Scoring ===
+
+    def zscore(self, lat, lon, values, min_count=None):
+        """z of each pixel against its own cell's climatology; 0 where history is too short."""
+        min_count = config.CLIM_MIN_COUNT if min_count is None else min_count
+        values = np.asarray(values, dtype=np.float64)
+        ids = self.grid.cell_ids(lat, lon)
+        z = np.zeros(values.shape)
+        ok = ids >= 0
+        idx = ids[ok]
+        n = self.count[idx]
+        std = np.sqrt(self.m2[idx] / np.maximum(n - 1, 1))
+        good = (n >= max(min_count, 2)) & (std > 0)
+        zi = np.zeros(len(idx))
+        zi[good] = (values[ok][good] - self.mean[idx][good]) / std[good]
+        z[ok] = np.where(np.isfinite(zi), zi, 0.0)
+        return z
@@ -9,8 +9,24 @@ PORT = 8000          # Flask API port
 DEBUG = True         # Enable debug mode for auto-reload
 
 # === File Paths ===
-FUSED_JSON = "./data/fused_data.json"
-FUSED_CSV = "./data/fused_data.csv"
+FUSED_JSON = "./data/fused_data.json"     # Frontend view, derived from the fused store
+DATA_PATH = FUSED_JSON                    # Served by /api/data
+FUSED_STORE_DIR = "./data/fused"          # Columnar store, partitioned by date and tile
+STORE_TILE_DEG = 10.0                     # Tile size (degrees) of fused store partitions
+INDEX_CACHE_DIR = "./data/cache/index"   # Persisted spatial indexes (keyed by grid hash)
+TEMPO_DIR = "./data/tempo"                # Incoming TEMPO L2 granules
+MERRA_PATH_PATTERN = "./data/MERRA2_{date:%Y%m%d}.nc4"   # MERRA-2 file per granule day
+FUSION_WORKERS = None                     # parallel_fusion processes (None = all cores)
+DOWNLOAD_WORKERS = 4                      # Concurrent granule transfers
+DOWNLOAD_CHUNK_BYTES = 1 << 20            # Streaming write size per transfer
+TILE_CACHE_DIR = "./data/cache/tiles"     # Tile pyramid + per-day finest bins (refreshed by fusion)
+WIND_CACHE_DIR = "./data/cache/wind"      # Memory-mapped MERRA-2 U/V arrays
+CLIMATOLOGY_DIR = "./data/climatology"    # Per-cell running NO2 baseline (memory-mapped)
+TIMESERIES_DIR = "./data/timeseries"      # Per-cell NO2 history, chunked by day x spatial block
+OPENAQ_BASE_URL = "https://api.openaq.org/v3"   # OpenAQ API root (point at a mock for tests)
+OPENAQ_WORKERS = 4                        # Concurrent OpenAQ page requests
+OPENAQ_LONG_CSV = "./data/openaq_measurements.csv"   # Long format: one row per station x parameter
+OPENAQ_STATE = "./data/openaq_sync_state.json"       # Last sync time + per-station fingerprints
 
 # === Column Mappings ===
 LAT_COL = "lat"              # Latitude column
@@ -24,6 +40,70 @@ ANOM_COL = "anomaly_flag"    # Detected anomaly flag
 # === Anomaly Detection Thresholds ===
 Z_CUTOFF = 2.0       # Z-score threshold for anomaly detection
 MIN_NO2 = 1e14       # Ignore unrealistically low NO2 values
+ANOMALY_MODE = "global"   # "global" granule z-score, "local" moving-window background,
+                          # or "climatology" (each cell against its own history)
+LOCAL_CELL_DEG = 0.05     # Grid cell (degrees) for the local background
+LOCAL_WINDOW_CELLS = 10   # Window half-width in cells (~1° window at 0.05°)
+LOCAL_MIN_COUNT = 20      # Pixels a window needs before it can flag anything
+CLIM_CELL_DEG = 0.1                    # Climatology cell size (degrees)
+CLIM_BOUNDS = (-170.0, 10.0, -10.0, 70.0)   # (west, south, east, north): TEMPO field of regard
+CLIM_MIN_COUNT = 30                    # History a cell needs before it can flag anything
+
+# === Globe Tiles (/api/tiles/<z>/<x>/<y>) ===
+TILE_MAX_ZOOM = 8        # Finest zoom served from the aggregation pyramid
+TILE_BIN_BITS = 6        # 2**6 x 2**6 bins per aggregated tile
+TILE_RAW_LIMIT = 20000   # Max raw pixels returned per tile above TILE_MAX_ZOOM
+HEATMAP_TILE_DIR = "./data/tiles/heatmap"   # Pre-rendered AQI heatmap PNG tiles ({z}/{x}/{y}.png)
+HEATMAP_MAX_ZOOM = 7     # Deepest zoom written by raster.write_xyz_tiles
+
+# === Plume Forecasts (/api/predict) ===
+PREDICT_CACHE_SIZE = 64      # Forecast payloads kept (LRU, keyed by dataset version + params)
+PREDICT_WORKERS = 2          # Background forecast threads
+PREDICT_SYNC_WAIT_S = 2.0    # Answer inline if the forecast finishes within this time, else 202 + job id
+PREDICT_MAX_HOURS = 72
+PREDICT_MAX_MEMBERS = 100
+PREDICT_MAX_PATH_POINTS = 2_000_000   # sources x members x steps; larger forecasts are refused
+
+# === Source Signatures (first matching rule wins) ===
+# Each rule: (label, [(column, op, threshold), ...]); ops are >, >=, <, <=, ==
+SIGNATURE_RULES = [
+    ("wildfire/biomass (hot & high NO₂)", [(NO2_COL, ">=", 2e16), (T2M_COL, ">", 300)]),
+    ("industrial/urban plume",            [(NO2_COL, ">=", 2e16), (PS_COL, ">", 101500)]),
+    ("stagnant/humid accumulation",       [(NO2_COL, ">=", 1e16), (QV2M_COL, ">", 0.012)]),
+    ("traffic/urban",                     [(NO2_COL, ">=", 1e16)]),
+]
+SIGNATURE_DEFAULT = "background"
+
+# === Hotspots (connected anomaly clusters) ===
+HOTSPOT_CELL_DEG = 0.05    # Grid cell (degrees) anomaly pixels are binned to before labelling
+HOTSPOT_MIN_PIXELS = 3     # Smaller clusters are dropped
+QUERY_CACHE_SIZE = 256     # Cached /api/hotspots-style query payloads (LRU)
+
+# === Point Queries (/api/nearest) ===
+NEAREST_HOURS = 0            # 0 = index the newest granule only; > 0 also keeps older pixels this many hours back
+NEAREST_COLUMNS = [NO2_COL, ANOM_COL, T2M_COL, QV2M_COL, PS_COL]   # Values returned per match
+NEAREST_MAX_POINTS = 10000   # Query points per request
+NEAREST_MAX_K = 50
+NEAREST_MAX_MATCHES = 100    # Per point, within-radius mode
+
+# === Time Series (/api/timeseries) ===
+TS_CELL_DEG = 0.1          # Series cell size (degrees), over CLIM_BOUNDS
+TS_BLOCK_CELLS = 32        # Chunk = one day x (32 x 32 cells) spatial block
+TS_MAX_DAYS = 92           # Longest range served per request
+
+# === Ground Validation (OpenAQ stations vs TEMPO pixels) ===
+COLLOC_RADIUS_KM = 10.0        # Pixels within this distance of a station are averaged
+COLLOC_WINDOW_MIN = 60         # ... if the granule is within this many minutes of the reading
+NO2_PBL_HEIGHT_M = 1000.0      # Well-mixed layer assumed when turning a column into surface ppb
+AIR_NUMBER_DENSITY = 2.46e19   # Surface air molecules per cm³
+VALIDATION_DIR = "./data/validation"   # Collocation matches + per-station statistics
+
+# === Dataset Statistics (/api/stats) ===
+STATS_COLUMNS = [NO2_COL, T2M_COL, QV2M_COL, PS_COL]   # Count / mean / std / min / max per column
+STATS_HISTOGRAMS = {                                    # column: (low, high, bins, "linear" | "log10")
+    NO2_COL: (13.0, 18.0, 50, "log10"),
+    T2M_COL: (220.0, 330.0, 55, "linear"),
+}
 
 # === Meteorological Defaults (used if missing from dataset) ===
 FALLBACK_WIND = (2.0, 1.0)   # (U, V) -> eastward & northward components (m/s)
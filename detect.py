@@ -5,10 +5,127 @@ from sklearn.preprocessing import StandardScaler
 import backend.config as config
 
 
-def refine_anomalies(df: pd.DataFrame) -> pd.DataFrame:
+class LocalBackground:
+    """Moving-window NO2 mean/std from summed-area tables.
+
+    Pixels are binned onto a regular cell_deg grid (count, sum, sum of squares per
+    cell), either all at once or chunk by chunk with add(). finalize() builds integral
+    images over the occupied extent, so every cell's (2w+1) x (2w+1) window statistics
+    cost four lookups, whatever the window size. zscore() then scores pixels against
+    the background of their own cell's window.
+    """
+
+    def __init__(self, cell_deg=None, window_cells=None, min_count=None):
+        self.cell_deg = cell_deg or config.LOCAL_CELL_DEG
+        self.window_cells = config.LOCAL_WINDOW_CELLS if window_cells is None else window_cells
+        self.min_count = config.LOCAL_MIN_COUNT if min_count is None else min_count
+        self.ncols = int(np.ceil(360.0 / self.cell_deg))
+        self.shift = None       # values are centred before squaring to keep precision
+        self._parts = []
+        self.mean = self.std = None
+
+    @classmethod
+    def from_points(cls, lat, lon, values, **kwargs):
+        bg = cls(**kwargs)
+        bg.add(lat, lon, values)
+        return bg.finalize()
+
+    def _cells(self, lat, lon):
+        row = np.floor((np.asarray(lat, dtype=float) + 90.0) / self.cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon, dtype=float) + 180.0) / self.cell_deg).astype(np.int64)
+        return row, np.clip(col, 0, self.ncols - 1)
+
+    def add(self, lat, lon, values):
+        """Accumulate one chunk of pixels (sparse per-cell sums)."""
+        values = np.asarray(values, dtype=np.float64)
+        ok = np.isfinite(values)
+        if not ok.any():
+            return self
+        if self.shift is None:
+            self.shift = float(values[ok].mean())
+        row, col = self._cells(np.asarray(lat)[ok], np.asarray(lon)[ok])
+        ids, inv = np.unique(row * self.ncols + col, return_inverse=True)
+        x = values[ok] - self.shift
+        self._parts.append((ids, np.bincount(inv, minlength=len(ids)),
+                            np.bincount(inv, weights=x, minlength=len(ids)),
+                            np.bincount(inv, weights=x * x, minlength=len(ids))))
+        return self
+
+    def finalize(self):
+        """Window mean/std for every cell of the occupied extent."""
+        if not self._parts:
+            self.mean = self.std = np.zeros((0, 0))
+            self.origin = (0, 0)
+            return self
+        ids = np.concatenate([p[0] for p in self._parts])
+        rows, cols = ids // self.ncols, ids % self.ncols
+        r0, c0 = rows.min(), cols.min()
+        shape = (rows.max() - r0 + 1, cols.max() - c0 + 1)
+        flat = (rows - r0) * shape[1] + (cols - c0)
+
+        tables = []
+        for k in (1, 2, 3):
+            grid = np.bincount(flat, weights=np.concatenate([p[k] for p in self._parts]),
+                               minlength=shape[0] * shape[1]).reshape(shape)
+            sat = np.zeros((shape[0] + 1, shape[1] + 1))
+            sat[1:, 1:] = grid.cumsum(0).cumsum(1)
+            tables.append(sat)
+        self._parts = []
+
+        w = self.window_cells
+        r = np.arange(shape[0])
+        c = np.arange(shape[1])
+        r1, r2 = np.clip(r - w, 0, shape[0])[:, None], np.clip(r + w + 1, 0, shape[0])[:, None]
+        c1, c2 = np.clip(c - w, 0, shape[1])[None, :], np.clip(c + w + 1, 0, shape[1])[None, :]
+        n, s, ss = (t[r2, c2] - t[r1, c2] - t[r2, c1] + t[r1, c1] for t in tables)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s / n
+            var = np.maximum(ss / n - mean * mean, 0.0)
+        enough = n >= max(self.min_count, 1)
+        self.mean = np.where(enough, mean + self.shift, np.nan)
+        self.std = np.where(enough, np.sqrt(var), np.nan)
+        self.origin = (r0, c0)
+        return self
+
+    def zscore(self, lat, lon, values):
+        """Local z-score of each pixel; 0 where the window is too sparse or flat."""
+        values = np.asarray(values, dtype=np.float64)
+        row, col = self._cells(lat, lon)
+        row, col = row - self.origin[0], col - self.origin[1]
+        inside = (row >= 0) & (row < self.mean.shape[0]) & (col >= 0) & (col < self.mean.shape[1])
+        z = np.zeros(values.shape)
+        mean = self.mean[row[inside], col[inside]]
+        std = self.std[row[inside], col[inside]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            zi = (values[inside] - mean) / std
+        z[inside] = np.where(np.isfinite(zi), zi, 0.0)
+        return z
+
+
+def refine_anomalies(df: pd.DataFrame, mode=None, climatology=None) -> pd.DataFrame:
+    """Set anomaly_flag by z-score: mode "global" (one granule-wide mean/std, keeps an
+    existing flag column), "local" (LocalBackground moving window) or "climatology"
+    (each pixel against its cell's history in climatology.Climatology)."""
+    mode = mode or config.ANOMALY_MODE
     out = df.copy()
 
-    if config.ANOM_COL not in out.columns:
+    if mode == "climatology":
+        if climatology is None:
+            from backend.climatology import Climatology
+            climatology = Climatology()
+        z = climatology.zscore(out[config.LAT_COL].values, out[config.LON_COL].values,
+                               out[config.NO2_COL].values)
+        out[config.ANOM_COL] = (z >= config.Z_CUTOFF).astype(int)
+    elif mode == "local":
+        bg = LocalBackground.from_points(out[config.LAT_COL].values, out[config.LON_COL].values,
+                                         out[config.NO2_COL].values)
+        z = bg.zscore(out[config.LAT_COL].values, out[config.LON_COL].values,
+                      out[config.NO2_COL].values)
+        out[config.ANOM_COL] = (z >= config.Z_CUTOFF).astype(int)
+    elif mode != "global":
+        raise ValueError(f"Unknown anomaly mode: {mode!r}")
+    elif config.ANOM_COL not in out.columns:
         mask = np.isfinite(out[config.NO2_COL].values)
         no2 = out.loc[mask, config.NO2_COL].values.reshape(-1, 1)
         z = StandardScaler().fit_transform(no2).ravel()
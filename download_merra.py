@@ -1,23 +1,21 @@
-import requests
-from tqdm import tqdm
-import xarray as xr
+import os
+from datetime import datetime
 
-url = "https://data.gesdisc.earthdata.nasa.gov/data/MERRA2/M2I1NXASM.5.12.4/2024/04/MERRA2_400.inst1_2d_asm_Nx.20240410.nc4"
-output = "MERRA2_20240410.nc4"
+import xarray as xr
 
-session = requests.Session()
-session.auth = ('your_username', 'your_password')
+import backend.config as config
+from backend.downloader import Downloader
 
-response = session.get(url, stream=True)
-response.raise_for_status()
+url = "https://data.gesdisc.earthdata.nasa.gov/data/MERRA2/M2I1NXASM.5.12.4/2024/04/MERRA2_400.inst1_2d_asm_Nx.20240410.nc4"
+# Saved where fusion_pipeline looks for the granule day's MERRA-2 file
+output = config.MERRA_PATH_PATTERN.format(date=datetime(2024, 4, 10))
 
-with open(output, "wb") as f:
-    for chunk in tqdm(response.iter_content(chunk_size=8192)):
-        if chunk:
-            f.write(chunk)
+# Earthdata credentials come from ~/.netrc; pass auth=(user, password) to override
+downloader = Downloader(os.path.dirname(output) or ".")
+path, status = downloader.fetch(url, name=os.path.basename(output))
 
-print("✅ MERRA-2 download complete:", output)
+print(f"✅ MERRA-2 download {status}:", path)
 
 # --- NEW CODE ---
-ds = xr.open_dataset("MERRA2_20240410.nc4")
+ds = xr.open_dataset(path)
 print(ds)
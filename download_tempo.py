@@ -4,11 +4,12 @@
 # Author: Mira Kabalan & ADIS Team
 # =======================================================
 
-import os
-import requests
-from tqdm import tqdm
+import re
 from datetime import datetime, timedelta
 
+import backend.config as config
+from backend.downloader import Downloader
+
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
@@ -16,9 +17,8 @@ from datetime import datetime, timedelta
 # Base URL for TEMPO NO2 Level 2 Data
 BASE_URL = "https://data.gesdisc.earthdata.nasa.gov/data/TEMPO_L2_NO2.001/"
 
-# Output directory
-OUTPUT_DIR = "tempo_data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Output directory (where fusion_pipeline.run_incremental looks for granules)
+OUTPUT_DIR = config.TEMPO_DIR
 
 # Earthdata credentials (must already exist in your ~/.netrc)
 # Example .netrc content:
@@ -30,12 +30,45 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 START_DATE = datetime(2024, 4, 10)
 END_DATE   = datetime(2024, 4, 12)   # inclusive
 
+GRANULE_RE = re.compile(r'href="([^"/]*TEMPO_NO2_L2[^"/]*\.nc)"')
+
 # -----------------------------
 # HELPER FUNCTIONS
 # -----------------------------
 
-def download_file(session, url, dest):
-    """Download one file with progress bar."""
-    response = session.get(url, stream=True)
-    if response.status_code == 200:
-        total_size = int(response.headers.get("content-length", 0))
+def day_url(day):
+    """Directory listing for one day: <BASE_URL>/<year>/<day of year>/"""
+    return f"{BASE_URL}{day:%Y}/{day:%j}/"
+
+
+def list_granules(session, day):
+    """Granule URLs listed in one day's directory (empty if the day is missing)."""
+    url = day_url(day)
+    response = session.get(url, timeout=60)
+    if response.status_code != 200:
+        print(f"⚠️ No listing for {day:%Y-%m-%d} ({response.status_code})")
+        return []
+    names = sorted(set(GRANULE_RE.findall(response.text)))
+    return [url + name for name in names]
+
+
+def main():
+    downloader = Downloader(OUTPUT_DIR)
+    urls = []
+    day = START_DATE
+    while day <= END_DATE:
+        urls.extend(list_granules(downloader.session(), day))
+        day += timedelta(days=1)
+    print(f"📡 {len(urls)} TEMPO granules listed for {START_DATE:%Y-%m-%d} to {END_DATE:%Y-%m-%d}")
+
+    results = downloader.fetch_all(urls)
+    cached = sum(1 for _, status in results.values() if status == "cached")
+    failed = {url: status for url, (path, status) in results.items() if path is None}
+    print(f"✅ {len(results) - cached - len(failed)} downloaded, {cached} already cached, "
+          f"{len(failed)} failed -> {OUTPUT_DIR}")
+    for url, error in failed.items():
+        print(f"❌ {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# downloader.py
+# --------------------------------------------
+# Shared download engine for ADIS (TEMPO, MERRA-2, ...)
+# - bounded pool of concurrent transfers, one pooled requests.Session
+#   per worker thread (keep-alive connections are reused across files)
+# - resumes partial files with HTTP Range requests
+# - writes <file>.part and renames it into place only once complete
+# - keeps a size + sha256 cache index, so finished files are skipped
+# Credentials come from ~/.netrc (requests' default) unless auth is given.
+# --------------------------------------------
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import backend.config as config
+
+INDEX_FILE = ".download_index.json"
+_CONTENT_RANGE_RE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    pass
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DownloadIndex:
+    """JSON index of completed downloads in one directory: name -> url/size/sha256."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, INDEX_FILE)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+    def is_complete(self, dest, verify_checksum=False):
+        """True if dest exists and matches its recorded size (and sha256 if asked)."""
+        entry = self.entries.get(os.path.basename(dest))
+        if entry is None or not os.path.exists(dest):
+            return False
+        if os.path.getsize(dest) != entry["size"]:
+            return False
+        return not verify_checksum or sha256_file(dest) == entry["sha256"]
+
+    def record(self, dest, url, size, digest):
+        with self._lock:
+            self.entries[os.path.basename(dest)] = {
+                "url": url,
+                "size": size,
+                "sha256": digest,
+                "completed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+class Downloader:
+    """Concurrent, resumable, cache-aware file fetcher."""
+
+    def __init__(self, out_dir, workers=None, auth=None, chunk_size=None, retries=3,
+                 timeout=60, verify_checksum=False):
+        self.out_dir = out_dir
+        self.workers = workers or config.DOWNLOAD_WORKERS
+        self.auth = auth
+        self.chunk_size = chunk_size or config.DOWNLOAD_CHUNK_BYTES
+        self.retries = retries
+        self.timeout = timeout
+        self.verify_checksum = verify_checksum
+        os.makedirs(out_dir, exist_ok=True)
+        self.index = DownloadIndex(out_dir)
+        self._local = threading.local()
+
+    def session(self):
+        """This thread's pooled Session (keep-alive connections reused across files)."""
+        sess = getattr(self._local, "session", None)
+        if sess is None:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            if self.auth is not None:
+                sess.auth = self.auth
+            self._local.session = sess
+        return sess
+
+    def dest_for(self, url, name=None):
+        return os.path.join(self.out_dir, name or os.path.basename(urlsplit(url).path))
+
+    # === One file ===
+
+    def fetch(self, url, name=None):
+        """Download url into out_dir. Returns (path, status) with status "cached" or "downloaded"."""
+        dest = self.dest_for(url, name)
+        if self.index.is_complete(dest, self.verify_checksum):
+            return dest, "cached"
+
+        last_error = None
+        for _ in range(self.retries + 1):
+            try:
+                self._transfer(url, dest)
+                return dest, "downloaded"
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and 400 <= status < 500 and status not in (408, 429):
+                    raise DownloadError(f"{url}: {e}") from e  # retrying will not help
+                last_error = e
+            except (requests.RequestException, DownloadError) as e:
+                last_error = e  # the .part file is kept, so the next attempt resumes
+        raise DownloadError(f"{url}: {last_error}")
+
+    def _transfer(self, url, dest):
+        part = f"{dest}.part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with self.session().get(url, stream=True, headers=headers, timeout=self.timeout) as resp:
+            if resp.status_code == 416 and offset:
+                # Nothing left to send: the part file may already be complete
+                total = self._total_size(resp)
+                if total != offset:
+                    os.remove(part)
+                    raise DownloadError(f"stale partial file ({offset} bytes, server has {total})")
+            else:
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    offset = 0  # server ignored the Range header: start over
+                total = self._total_size(resp)
+                with open(part, "ab" if offset else "wb") as f:
+                    for block in resp.iter_content(chunk_size=self.chunk_size):
+                        if block:
+                            f.write(block)
+
+        size = os.path.getsize(part)
+        if total is not None and size != total:
+            raise DownloadError(f"incomplete transfer ({size} of {total} bytes)")
+        digest = sha256_file(part)
+        os.replace(part, dest)
+        self.index.record(dest, url, size, digest)
+
+    @staticmethod
+    def _total_size(resp):
+        """Full file size from Content-Range (206/416) or Content-Length (200)."""
+        match = _CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+        if match and match.group(3) != "*":
+            return int(match.group(3))
+        if resp.status_code == 200 and "Content-Length" in resp.headers:
+            return int(resp.headers["Content-Length"])
+        return None
+
+    # === Many files ===
+
+    def fetch_all(self, urls, progress=True):
+        """Fetch urls with at most `workers` concurrent transfers.
+
+        Returns {url: (path, status)}; failed urls map to (None, error message).
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="adis-dl") as pool:
+            futures = {pool.submit(self.fetch, url): url for url in urls}
+            done = as_completed(futures)
+            if progress:
+                try:
+                    from tqdm import tqdm
+                    done = tqdm(done, total=len(futures), unit="file")
+                except ImportError:
+                    pass
+            for future in done:
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except DownloadError as e:
+                    results[url] = (None, str(e))
+        return results
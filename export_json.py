@@ -1,24 +1,10 @@
-import pandas as pd
-import json
+# export_json.py
+# Rebuild the frontend's fused_data.json view from the columnar fused store.
+import backend.config as config
+from backend.fused_store import FusedStore, export_json_view
 
-input_csv = "./data/fused_data.csv"
-output_json = "./data/fused_data.json"
+output_json = config.FUSED_JSON
 
-df = pd.read_csv(input_csv)
+count = export_json_view(FusedStore(), output_json, variables=["T2M"])
 
-# Convert to GeoJSON-like format for frontend visualization
-geojson = [
-    {
-        "lat": float(row["lat"]),
-        "lon": float(row["lon"]),
-        "NO2": float(row.get("NO2", 0)),
-        "anomaly_flag": int(row.get("anomaly_flag", 0)),
-        "T2M": float(row.get("T2M", 0)),
-    }
-    for _, row in df.iterrows()
-]
-
-with open(output_json, "w") as f:
-    json.dump(geojson, f, indent=2)
-
-print(f"✅ Exported {len(geojson)} records to {output_json}")
+print(f"✅ Exported {count} records to {output_json}")
@@ -0,0 +1,310 @@
+# fused_store.py
+# --------------------------------------------
+# Columnar, partitioned store for ADIS fused output
+# Layout: <root>/date=YYYY-MM-DD/tile=<row>_<col>/<part>/<column>.npy
+# (tile row / col are integer indices: origin = index * STORE_TILE_DEG)
+# Every column is a plain .npy array (float32 for measurements), so reads
+# are memory-mapped and only the requested columns are touched. Date and
+# tile directories plus each part's _meta.json (row count, bbox, time
+# range) let bbox/time predicates skip whole partitions before any column
+# is opened. The frontend JSON is derived from the store on demand.
+# --------------------------------------------
+
+import json
+import os
+import shutil
+import uuid
+from glob import escape, glob
+
+import numpy as np
+import pandas as pd
+
+import backend.config as config
+
+META_FILE = "_meta.json"
+VERSION_FILE = "_version"
+TIME_COL = "granule_time"
+
+
+def tile_index(lat, lon, tile_deg):
+    """Integer (row, col) of the tile holding each point; the origin is index * tile_deg."""
+    return (np.floor(np.asarray(lat, dtype=float) / tile_deg).astype(np.int64),
+            np.floor(np.asarray(lon, dtype=float) / tile_deg).astype(np.int64))
+
+
+def tile_name(row, col):
+    return f"tile={int(row):+05d}_{int(col):+05d}"
+
+
+def tile_extent(name, tile_deg):
+    """[lat_min, lon_min, lat_max, lon_max] of a "tile=+0002_-0010" directory (tile indices)."""
+    row, col = (int(v) for v in name[len("tile="):].split("_"))
+    lat0, lon0 = row * tile_deg, col * tile_deg
+    return [lat0, lon0, lat0 + tile_deg, lon0 + tile_deg]
+
+
+def parse_bbox(bbox):
+    """(west, south, east, north) from a tuple or "w,s,e,n" string; None passes through."""
+    if bbox is None:
+        return None
+    if isinstance(bbox, str):
+        bbox = bbox.split(",")
+    west, south, east, north = (float(v) for v in bbox)
+    return west, south, east, north
+
+
+def bbox_mask(lat, lon, bbox):
+    """Points inside (west, south, east, north); west > east wraps the antimeridian."""
+    west, south, east, north = bbox
+    ok = (lat >= south) & (lat <= north)
+    if west <= east:
+        return ok & (lon >= west) & (lon <= east)
+    return ok & ((lon >= west) | (lon <= east))
+
+
+def _bbox_overlaps(extent, bbox):
+    """Does a part's [lat_min, lon_min, lat_max, lon_max] extent touch bbox?"""
+    lat_min, lon_min, lat_max, lon_max = extent
+    west, south, east, north = bbox
+    if lat_max < south or lat_min > north:
+        return False
+    if west <= east:
+        return not (lon_max < west or lon_min > east)
+    return lon_max >= west or lon_min <= east
+
+
+def _utc_naive(value):
+    """Timestamp-like -> naive UTC pandas Timestamp (the store's time convention)."""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_convert("UTC").tz_localize(None) if ts.tzinfo is not None else ts
+
+
+def _encode_column(series):
+    """Series -> (array to save, column meta)."""
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series.dtype) \
+            or series.dtype == object:
+        cat = series.astype("category")
+        return (cat.cat.codes.to_numpy(dtype=np.int16),
+                {"kind": "category", "categories": [str(c) for c in cat.cat.categories]})
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        return values.to_numpy(dtype="datetime64[s]"), {"kind": "datetime"}
+    if pd.api.types.is_float_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float32), {"kind": "float"}
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy(dtype=np.int8), {"kind": "int"}
+    return series.to_numpy(), {"kind": "int"}
+
+
+def _decode_column(values, meta):
+    if meta["kind"] == "category":
+        return pd.Categorical.from_codes(np.asarray(values), categories=meta["categories"])
+    return values
+
+
+class FusedStore:
+    """Date/tile partitioned directory of memory-mappable column files."""
+
+    def __init__(self, root=None, tile_deg=None):
+        self.root = root or config.FUSED_STORE_DIR
+        self.tile_deg = float(tile_deg or config.STORE_TILE_DEG)
+
+    # === Writes ===
+
+    def write_part(self, df, part, time=None):
+        """Split df by tile and write one part directory per tile. Returns the paths written.
+
+        time (a granule timestamp) is stored as the granule_time column and picks the
+        date partition; without it, the df's own granule_time column is used if present.
+        """
+        if df.empty:
+            return []
+        df = df.reset_index(drop=True)
+        if time is not None:
+            df[TIME_COL] = _utc_naive(time)
+        if TIME_COL in df.columns:
+            df[TIME_COL] = pd.to_datetime(df[TIME_COL], utc=True).dt.tz_localize(None)
+            dates = df[TIME_COL].dt.strftime("%Y-%m-%d")
+        else:
+            dates = pd.Series("undated", index=df.index)
+
+        rows_idx, cols_idx = tile_index(df[config.LAT_COL], df[config.LON_COL], self.tile_deg)
+        written = []
+        for (date, t_row, t_col), rows in df.groupby([dates, rows_idx, cols_idx], sort=True).indices.items():
+            out_dir = os.path.join(self.root, f"date={date}", tile_name(t_row, t_col), part)
+            self._write_dir(df.iloc[rows], out_dir, part, date)
+            written.append(out_dir)
+        self._bump_version()
+        return written
+
+    def _write_dir(self, df, out_dir, part, date):
+        """Write columns to a temp directory, then rename it into place."""
+        tmp = f"{out_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = {}
+        for col in df.columns:
+            values, meta = _encode_column(df[col])
+            np.save(os.path.join(tmp, f"{col}.npy"), values, allow_pickle=False)
+            columns[col] = meta
+
+        lat = df[config.LAT_COL].to_numpy(dtype=float)
+        lon = df[config.LON_COL].to_numpy(dtype=float)
+        meta = {
+            "part": part,
+            "date": date,
+            "rows": int(len(df)),
+            "columns": columns,
+            "extent": [float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())],
+        }
+        if TIME_COL in df.columns:
+            t = df[TIME_COL]
+            meta["time"] = [t.min().isoformat(), t.max().isoformat()]
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp, out_dir)
+
+    def drop(self, part):
+        """Remove every directory written for part or its "<part>-NNNN" chunks."""
+        removed = 0
+        for name in (escape(part), escape(part) + "-*"):
+            for path in glob(os.path.join(self.root, "date=*", "tile=*", name)):
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            self._bump_version()
+        return removed
+
+    def _bump_version(self):
+        """Give the store a new version token (atomic, safe across writer processes)."""
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, VERSION_FILE)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, path)
+
+    # === Partition pruning ===
+
+    def partitions(self, bbox=None, start=None, end=None):
+        """(path, meta) of every part that may hold rows matching bbox/start/end."""
+        bbox = parse_bbox(bbox)
+        start, end = _utc_naive(start), _utc_naive(end)
+        found = []
+        for date_dir in sorted(glob(os.path.join(self.root, "date=*"))):
+            date = os.path.basename(date_dir)[len("date="):]
+            if date != "undated":
+                day = pd.Timestamp(date)
+                if (start is not None and day + pd.Timedelta(days=1) <= start) or \
+                        (end is not None and day > end):
+                    continue
+            for tile_dir in sorted(glob(os.path.join(date_dir, "tile=*"))):
+                if bbox is not None and not _bbox_overlaps(
+                        tile_extent(os.path.basename(tile_dir), self.tile_deg), bbox):
+                    continue
+                found.extend(self._tile_parts(tile_dir, bbox, start, end))
+        return found
+
+    def _tile_parts(self, tile_dir, bbox, start, end):
+        found = []
+        for meta_path in sorted(glob(os.path.join(tile_dir, "*", META_FILE))):
+            if ".tmp" in os.path.basename(os.path.dirname(meta_path)):
+                continue  # a write in progress
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if bbox is not None and not _bbox_overlaps(meta["extent"], bbox):
+                continue
+            if "time" in meta:
+                t0, t1 = (pd.Timestamp(t) for t in meta["time"])
+                if (start is not None and t1 < start) or (end is not None and t0 > end):
+                    continue
+            found.append((os.path.dirname(meta_path), meta))
+        return found
+
+    def latest_time(self):
+        """Newest granule_time in the store, or None; only the newest date partition is read."""
+        dates = sorted(glob(os.path.join(self.root, "date=*")), reverse=True)
+        for date_dir in dates:
+            if date_dir.endswith("date=undated"):
+                continue
+            times = [pd.Timestamp(meta["time"][1])
+                     for tile_dir in glob(os.path.join(date_dir, "tile=*"))
+                     for _, meta in self._tile_parts(tile_dir, None, None, None) if "time" in meta]
+            if times:
+                return max(times)
+        return None
+
+    def version(self):
+        """Token that changes on every write_part / drop: one small file read per call."""
+        try:
+            with open(os.path.join(self.root, VERSION_FILE), "r") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return "empty"
+
+    # === Reads ===
+
+    def iter_parts(self, columns=None, bbox=None, start=None, end=None):
+        """Yield one filtered DataFrame per matching part, loading only the needed columns."""
+        bbox = parse_bbox(bbox)
+        start, end = _utc_naive(start), _utc_naive(end)
+        need_time = start is not None or end is not None
+        for path, meta in self.partitions(bbox, start, end):
+            cols = list(meta["columns"]) if columns is None else list(columns)
+            mask = np.ones(meta["rows"], dtype=bool)
+            if bbox is not None:
+                lat = self._load(path, config.LAT_COL)
+                lon = self._load(path, config.LON_COL)
+                mask &= bbox_mask(lat, lon, bbox)
+            if need_time and TIME_COL in meta["columns"]:
+                t = self._load(path, TIME_COL)
+                if start is not None:
+                    mask &= t >= start.to_datetime64()
+                if end is not None:
+                    mask &= t <= end.to_datetime64()
+            if not mask.any():
+                continue
+            take = None if mask.all() else np.flatnonzero(mask)
+
+            data = {}
+            for col in cols:
+                if col not in meta["columns"]:
+                    data[col] = np.full(int(mask.sum()), np.nan, dtype=np.float32)
+                    continue
+                values = self._load(path, col)
+                values = values[take] if take is not None else np.asarray(values)
+                data[col] = _decode_column(values, meta["columns"][col])
+            yield pd.DataFrame(data)
+
+    def read(self, columns=None, bbox=None, start=None, end=None):
+        """Concatenate every matching part into one DataFrame."""
+        frames = list(self.iter_parts(columns, bbox, start, end))
+        if not frames:
+            return pd.DataFrame({c: pd.Series(dtype=float) for c in (columns or [])})
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _load(path, col):
+        return np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r", allow_pickle=False)
+
+
+# === Derived views ===
+
+JSON_COLUMNS = ["lat", "lon", "NO2", "anomaly_flag"]
+
+
+def export_json_view(store, json_out=None, variables=(), **predicates):
+    """Write the frontend's list-of-records JSON from the store (compatibility view)."""
+    json_out = json_out or config.FUSED_JSON
+    columns = JSON_COLUMNS + [v for v in variables if v not in JSON_COLUMNS]
+    df = store.read(columns=columns, **predicates)
+    df["anomaly_flag"] = df["anomaly_flag"].fillna(0).astype(int)
+    os.makedirs(os.path.dirname(json_out) or ".", exist_ok=True)
+    tmp = f"{json_out}.tmp"
+    df.to_json(tmp, orient="records", double_precision=6)
+    os.replace(tmp, json_out)
+    return len(df)
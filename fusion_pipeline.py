@@ -2,129 +2,572 @@
 # ------------------
 # ADIS - Data Fusion Pipeline
 # Fuses TEMPO, MERRA-2, and OpenAQ datasets into one master file.
+#
+# Run as a script for the single-granule pipeline, or import
+# run_incremental() to fuse a directory of TEMPO granules.
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from glob import glob
+from itertools import chain
 
 import pandas as pd
 import numpy as np
 import xarray as xr
-import h5py
 from scipy.spatial import cKDTree
 from sklearn.preprocessing import StandardScaler
 
-print("🚀 Starting ADIS Fusion Pipeline...")
+import backend.config as config
+from backend.climatology import Climatology
+from backend.detect import LocalBackground
+from backend.fused_store import TIME_COL, FusedStore, export_json_view
+from backend.regrid import interp_to_points
+from backend.spatial_index import SphericalIndex, chord_to_km, km_to_chord, latlon_to_xyz
+from backend.tempo_reader import chunk_to_frame, iter_tempo_chunks, read_tempo
+from backend.tile_pyramid import refresh_pyramid
+from backend.timeseries import TimeSeriesStore
+from backend.utils import no2_column_to_ppb, parse_granule_time
+
+MERRA_VARS = ["T2M", "QV2M", "PS", "TQI"]
+
+# MERRA-2 collocation: "bilinear" / "nearest" sample the regular grid directly,
+# "kdtree" averages every grid point within MERRA_RADIUS_KM (legacy behaviour).
+MERRA_FUSE_MODE = "bilinear"
+MERRA_RADIUS_KM = 400
+
 
 # ============================================================
-# 1. Load MERRA-2 Dataset
+# 1. MERRA-2
 # ============================================================
-print("\n📂 Loading MERRA-2 dataset...")
-merra_path = "./data/MERRA2_20240410.nc4"
-ds_vars = ["T2M", "QV2M", "PS", "TQI"]
+def load_merra(path, variables=MERRA_VARS):
+    """Open a MERRA-2 file and return (daily-mean dataset, available variables)."""
+    ds = xr.open_dataset(path)
+    available_vars = [v for v in variables if v in ds.data_vars]
+    return ds[available_vars].mean(dim=["time"]), available_vars
+
 
-ds = xr.open_dataset(merra_path)
-available_vars = [v for v in ds_vars if v in ds.data_vars]
-df_merra = ds[available_vars].mean(dim=["time"]).to_dataframe().reset_index()
+def merra_to_frame(ds_mean):
+    """Flatten the MERRA-2 grid into a lat/lon DataFrame (kdtree mode only)."""
+    df_merra = ds_mean.to_dataframe().reset_index()
 
-# Flatten spatial structure if present
-if "lat" not in df_merra.columns:
-    df_merra["lat"] = np.linspace(-90, 90, len(df_merra))
-if "lon" not in df_merra.columns:
-    df_merra["lon"] = np.linspace(-180, 180, len(df_merra))
+    # Flatten spatial structure if present
+    if "lat" not in df_merra.columns:
+        df_merra["lat"] = np.linspace(-90, 90, len(df_merra))
+    if "lon" not in df_merra.columns:
+        df_merra["lon"] = np.linspace(-180, 180, len(df_merra))
+
+    return df_merra.dropna(subset=["lat", "lon"])
 
-df_merra.dropna(subset=["lat", "lon"], inplace=True)
-print(f"✅ Loaded MERRA-2 variables: {available_vars}")
-df_merra.to_csv("./data/cleaned_merra2.csv", index=False)
 
 # ============================================================
-# 2. Load TEMPO Dataset
+# 2. TEMPO
 # ============================================================
-print("\n📡 Loading TEMPO dataset...")
-tempo_path = "./data/tempo/TEMPO_NO2_L2_V03_20250406T215103Z_S012G07.nc"
-
-with h5py.File(tempo_path, "r") as f:
-    no2 = f["product/vertical_column_troposphere"][:]
-    lat = f["geolocation/latitude"][:]
-    lon = f["geolocation/longitude"][:]
-
-tempo_df = pd.DataFrame({
-    "lat": lat.flatten(),
-    "lon": lon.flatten(),
-    "NO2": no2.flatten()
-})
-tempo_df = tempo_df.dropna(subset=["NO2"])
-print(f"✅ TEMPO dataset processed: {len(tempo_df)} valid points")
-
-# Detect anomalies (Z-score)
-scaler = StandardScaler()
-tempo_df["NO2_z"] = scaler.fit_transform(tempo_df[["NO2"]])
-tempo_df["anomaly_flag"] = np.where(tempo_df["NO2_z"] > 2, 1, 0)
+def load_tempo(path):
+    """Read one TEMPO L2 granule into a flat lat/lon/NO2 DataFrame (quality-masked)."""
+    return read_tempo(path)
+
+
+def flag_anomalies(tempo_df, anomaly_mode=None, climatology=None):
+    """Add NO2_z and anomaly_flag (z-score above Z_CUTOFF) to a TEMPO frame.
+
+    anomaly_mode "local" scores against a moving-window background instead of the
+    granule-wide mean/std (see detect.LocalBackground); "climatology" scores each
+    pixel against its cell's history (climatology.Climatology).
+    """
+    anomaly_mode = anomaly_mode or config.ANOMALY_MODE
+    if anomaly_mode not in ("global", "local", "climatology"):
+        raise ValueError(f"Unsupported anomaly mode: {anomaly_mode!r}")
+    if tempo_df.empty:
+        tempo_df["NO2_z"] = pd.Series(dtype=float)
+        tempo_df["anomaly_flag"] = pd.Series(dtype=int)
+        return tempo_df
+    if anomaly_mode == "local":
+        bg = LocalBackground.from_points(tempo_df["lat"].values, tempo_df["lon"].values,
+                                         tempo_df["NO2"].values)
+        tempo_df["NO2_z"] = bg.zscore(tempo_df["lat"].values, tempo_df["lon"].values,
+                                      tempo_df["NO2"].values)
+    elif anomaly_mode == "climatology":
+        climatology = climatology or Climatology()
+        tempo_df["NO2_z"] = climatology.zscore(tempo_df["lat"].values, tempo_df["lon"].values,
+                                               tempo_df["NO2"].values)
+    else:
+        tempo_df["NO2_z"] = StandardScaler().fit_transform(tempo_df[["NO2"]])
+    tempo_df["anomaly_flag"] = np.where(tempo_df["NO2_z"] > config.Z_CUTOFF, 1, 0)
+    return tempo_df
+
 
 # ============================================================
-# 3. Load OpenAQ Ground Dataset
+# 3. OpenAQ
 # ============================================================
-print("\n🌍 Loading OpenAQ dataset...")
-try:
-    openaq_df = pd.read_csv("./data/openaq_latest.csv")
-    openaq_df.rename(columns={
-        "coordinates.latitude": "lat",
-        "coordinates.longitude": "lon"
-    }, inplace=True)
-    if "lat" in openaq_df.columns and "lon" in openaq_df.columns:
-        print(f"✅ OpenAQ records loaded: {len(openaq_df)}")
-    else:
+OPENAQ_PATHS = [config.OPENAQ_LONG_CSV, "./data/openaq_latest.csv", "./openaq_latest.csv"]
+_OPENAQ_COORDS = {
+    "coordinates.latitude": "lat", "coordinates.longitude": "lon",
+    "coordinates_latitude": "lat", "coordinates_longitude": "lon",
+    "latitude": "lat", "longitude": "lon",
+}
+# NO2 unit -> factor to ppb (µg/m³ at 25 °C, 1 atm)
+_NO2_TO_PPB = {"ppb": 1.0, "ppm": 1000.0, "µg/m³": 1 / 1.88, "ug/m3": 1 / 1.88, "μg/m³": 1 / 1.88}
+
+
+def load_openaq(path=None):
+    """Load ground stations with lat/lon columns, or an empty frame.
+
+    Reads the long-format table written by openaq_sync (or a legacy openaq_fetch CSV,
+    from ./data or the working directory) and normalizes coordinate column names.
+    """
+    if path is None:
+        path = next((p for p in OPENAQ_PATHS if os.path.exists(p)), OPENAQ_PATHS[0])
+    try:
+        openaq_df = pd.read_csv(path)
+        openaq_df.rename(columns=_OPENAQ_COORDS, inplace=True)
+        if "lat" in openaq_df.columns and "lon" in openaq_df.columns:
+            print(f"✅ OpenAQ records loaded: {len(openaq_df)}")
+            return openaq_df
         print("⚠️ OpenAQ lacks lat/lon columns; skipping ground merge.")
-        openaq_df = pd.DataFrame()
-except Exception as e:
-    print(f"⚠️ Skipping OpenAQ due to error: {e}")
-    openaq_df = pd.DataFrame()
+    except Exception as e:
+        print(f"⚠️ Skipping OpenAQ due to error: {e}")
+    return pd.DataFrame()
+
+
+def station_no2(openaq_df):
+    """NO2 readings only, as ppb with a UTC-naive `time` column."""
+    if openaq_df.empty or "parameter" not in openaq_df.columns:
+        return pd.DataFrame(columns=["location_id", "lat", "lon", "time", "ground_ppb"])
+    df = openaq_df[openaq_df["parameter"].astype(str).str.lower() == "no2"].copy()
+    if "location_id" not in df.columns:
+        df["location_id"] = df.get("location", pd.Series(range(len(df)), index=df.index)).astype(str)
+    factor = df["unit"].map(_NO2_TO_PPB) if "unit" in df.columns else 1.0
+    df["ground_ppb"] = pd.to_numeric(df["value"], errors="coerce") * factor
+    df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce").dt.tz_localize(None)
+    df = df.dropna(subset=["lat", "lon", "time", "ground_ppb"])
+    return df[df["ground_ppb"] >= 0].reset_index(drop=True)
+
+
+def collocate_stations(stations, store=None, radius_km=None, window_minutes=None):
+    """Match each station reading to the TEMPO pixels near it in space and time.
+
+    Pixels within radius_km of a station, from granules within window_minutes of its
+    reading, are averaged. Station and pixel KD-trees on the unit sphere are joined
+    granule by granule with one sparse_distance_matrix call, so there is no Python
+    loop over stations. Returns the station rows plus sat_no2 (column),
+    sat_ppb (surface proxy), n_pixels and mean_dist_km; unmatched readings are dropped.
+    """
+    store = store or FusedStore()
+    radius_km = radius_km or config.COLLOC_RADIUS_KM
+    window = np.timedelta64(int((window_minutes or config.COLLOC_WINDOW_MIN) * 60), "s")
+    stations = stations.reset_index(drop=True)
+    n = len(stations)
+    count, no2_sum, dist_sum = np.zeros(n), np.zeros(n), np.zeros(n)
+
+    if n:
+        times = stations["time"].to_numpy("datetime64[ns]")
+        xyz = latlon_to_xyz(stations["lat"].values, stations["lon"].values)
+        chord = float(km_to_chord(radius_km))
+        pad = radius_km * config.DEG_PER_KM
+        lon_pad = min(180.0, pad / max(np.cos(np.deg2rad(min(89.0, np.abs(stations["lat"]).max() + pad))), 1e-3))
+        bbox = (stations["lon"].min() - lon_pad, stations["lat"].min() - pad,
+                stations["lon"].max() + lon_pad, stations["lat"].max() + pad)
+        if bbox[2] - bbox[0] >= 360:
+            bbox = None
+        columns = [config.LAT_COL, config.LON_COL, config.NO2_COL, TIME_COL]
+        for chunk in store.iter_parts(columns, bbox=bbox, start=times.min() - window, end=times.max() + window):
+            chunk = chunk[np.isfinite(chunk[config.NO2_COL].values)]
+            for stamp, pixels in chunk.groupby(TIME_COL):
+                near = np.flatnonzero(np.abs(times - np.datetime64(stamp)) <= window)
+                if not len(near):
+                    continue
+                pix_tree = cKDTree(latlon_to_xyz(pixels[config.LAT_COL].values, pixels[config.LON_COL].values))
+                pairs = cKDTree(xyz[near]).sparse_distance_matrix(pix_tree, chord, output_type="ndarray")
+                if not len(pairs):
+                    continue
+                rows = near[pairs["i"]]
+                count += np.bincount(rows, minlength=n)
+                no2_sum += np.bincount(rows, weights=pixels[config.NO2_COL].values[pairs["j"]], minlength=n)
+                dist_sum += np.bincount(rows, weights=chord_to_km(pairs["v"]), minlength=n)
+
+    matched = count > 0
+    out = stations[matched].copy()
+    out["n_pixels"] = count[matched].astype(int)
+    out["sat_no2"] = no2_sum[matched] / count[matched]
+    out["sat_ppb"] = no2_column_to_ppb(out["sat_no2"].values)
+    out["mean_dist_km"] = dist_sum[matched] / count[matched]
+    return out.reset_index(drop=True)
+
+
+def collocation_stats(matches, by="location_id"):
+    """Bias / RMSE / Pearson r of sat_ppb vs ground_ppb per group (one row overall if by=None)."""
+    x = matches["sat_ppb"].to_numpy(float)
+    y = matches["ground_ppb"].to_numpy(float)
+    keys = matches[by] if by is not None else pd.Series(np.zeros(len(matches), dtype=int), index=matches.index)
+    sums = pd.DataFrame({"n": 1, "x": x, "y": y, "xx": x * x, "yy": y * y, "xy": x * y,
+                         "d2": (x - y) ** 2}, index=matches.index).groupby(keys.values).sum()
+    n = sums["n"]
+    out = pd.DataFrame({
+        "n": n,
+        "ground_mean_ppb": sums["y"] / n,
+        "sat_mean_ppb": sums["x"] / n,
+        "bias_ppb": (sums["x"] - sums["y"]) / n,
+        "rmse_ppb": np.sqrt(sums["d2"] / n),
+    })
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sums["xy"] - sums["x"] * sums["y"]
+        var = (n * sums["xx"] - sums["x"] ** 2) * (n * sums["yy"] - sums["y"] ** 2)
+        out["r"] = np.where((n >= 3) & (var > 0), cov / np.sqrt(var), np.nan)
+    if by is not None:
+        first = matches.groupby(by)[["lat", "lon"]].first()
+        out = first.join(out).reset_index().rename(columns={"index": by})
+    return out.reset_index(drop=True) if by is None else out
+
+
+def validate_against_stations(openaq_df, store=None, out_dir=None, **kwargs):
+    """Collocate NO2 station readings with the store and write matches + per-station stats."""
+    out_dir = out_dir or config.VALIDATION_DIR
+    matches = collocate_stations(station_no2(openaq_df), store=store, **kwargs)
+    if matches.empty:
+        return matches, pd.DataFrame()
+    stats = collocation_stats(matches)
+    os.makedirs(out_dir, exist_ok=True)
+    matches.to_csv(os.path.join(out_dir, "station_matches.csv"), index=False)
+    stats.to_csv(os.path.join(out_dir, "station_stats.csv"), index=False)
+    return matches, stats
+
 
 # ============================================================
-# 4. Spatial Fusion (using KDTree)
+# 4. Spatial Fusion
 # ============================================================
-print("\n🔗 Fusing datasets (spatial proximity join)...")
+def _neighbors_to_csr(idxs):
+    """Flatten ragged query_ball_point output into CSR (indptr, indices)."""
+    counts = np.fromiter((len(n) for n in idxs), dtype=np.int64, count=len(idxs))
+    indptr = np.zeros(len(idxs) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.fromiter(chain.from_iterable(idxs), dtype=np.int64, count=int(indptr[-1]))
+    return indptr, indices
+
+
+def aggregate_neighbors(values, indptr, indices, weights=None):
+    """NaN-aware (weighted) mean of `values` rows over every CSR neighbor list at once."""
+    n_rows = len(indptr) - 1
+    row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+    w = np.ones(len(indices)) if weights is None else np.asarray(weights, dtype=float)
+
+    out = np.full((n_rows, values.shape[1]), np.nan)
+    for j in range(values.shape[1]):
+        col = values[indices, j]
+        ok = np.isfinite(col)
+        wsum = np.bincount(row_ids[ok], weights=w[ok], minlength=n_rows)
+        vsum = np.bincount(row_ids[ok], weights=col[ok] * w[ok], minlength=n_rows)
+        np.divide(vsum, wsum, out=out[:, j], where=wsum > 0)
+    return out
 
-def fast_spatial_fuse(df1, df2, lat1, lon1, lat2, lon2, radius_km=250):
-    """Fuse two datasets using KDTree proximity (in kilometers)."""
-    R = 6371.0  # Earth radius
-    df1_rad = np.deg2rad(df1[[lat1, lon1]].values)
-    df2_rad = np.deg2rad(df2[[lat2, lon2]].values)
 
-    tree = cKDTree(df2_rad)
-    radius = radius_km / R
-    idxs = tree.query_ball_point(df1_rad, r=radius)
+def fast_spatial_fuse(df1, df2, lat1, lon1, lat2, lon2, radius_km=250,
+                      weighting=None, power=2.0, index=None):
+    """Fuse two datasets by great-circle proximity (in kilometers).
 
-    joined = []
-    for i, neighbors in enumerate(idxs):
-        if not neighbors:
+    Every df1 row with at least one df2 neighbor gets the mean of the neighbors'
+    numeric columns. weighting="idw" switches to inverse-distance weights 1/d**power.
+    The df2 index is loaded from (or saved to) the on-disk cache unless one is passed in.
+    """
+    if index is None:
+        index = SphericalIndex.cached(df2[lat2].values, df2[lon2].values)
+    q_lat, q_lon = df1[lat1].values, df1[lon1].values
+    idxs = index.query_ball(q_lat, q_lon, radius_km)
+    indptr, indices = _neighbors_to_csr(idxs)
+
+    weights = None
+    if weighting == "idw":
+        row_ids = np.repeat(np.arange(len(df1)), np.diff(indptr))
+        dist_km = index.distance_km(q_lat[row_ids], q_lon[row_ids], indices)
+        weights = 1.0 / np.maximum(dist_km, 1e-3) ** power
+    elif weighting is not None:
+        raise ValueError(f"Unknown weighting: {weighting!r}")
+
+    # Keep df1's own coordinates; aggregate every other numeric df2 column
+    value_cols = [c for c in df2.select_dtypes(include="number").columns
+                  if c not in (lat2, lon2)]
+    means = aggregate_neighbors(df2[value_cols].to_numpy(dtype=float), indptr, indices, weights)
+
+    has_neighbors = np.diff(indptr) > 0
+    fused = df1.loc[has_neighbors].reset_index(drop=True)
+    for j, col in enumerate(value_cols):
+        fused[col] = means[has_neighbors, j]
+    return fused
+
+
+def grid_fuse(df, ds_grid, variables, lat_col="lat", lon_col="lon", method="bilinear"):
+    """Fuse gridded fields onto df points by direct grid interpolation (no tree search)."""
+    fused = df.reset_index(drop=True)
+    sampled = interp_to_points(ds_grid, variables, fused[lat_col].values,
+                               fused[lon_col].values, method=method)
+    for var in variables:
+        fused[var] = sampled[var]
+    return fused
+
+
+def fuse_granule(tempo_df, ds_mean, variables, mode=None, radius_km=MERRA_RADIUS_KM):
+    """Collocate MERRA-2 variables onto TEMPO pixels using the configured mode."""
+    mode = mode or MERRA_FUSE_MODE
+    if mode == "kdtree":
+        return fast_spatial_fuse(tempo_df, merra_to_frame(ds_mean), "lat", "lon", "lat", "lon",
+                                 radius_km=radius_km)
+    return grid_fuse(tempo_df, ds_mean, variables, method=mode)
+
+
+def no2_moments(chunks):
+    """One pass over reader chunks -> (count, mean, std) of NO2 for the z-score."""
+    n, mean, m2 = 0, 0.0, 0.0
+    for chunk in chunks:
+        x = chunk["NO2"].astype(np.float64)
+        if not len(x):
             continue
-        mean_vals = df2.iloc[neighbors].mean(numeric_only=True)
-        row = df1.iloc[i].to_dict()
-        row.update(mean_vals.to_dict())
-        joined.append(row)
+        # Chan et al. merge of per-chunk (count, mean, M2)
+        k, x_mean = len(x), x.mean()
+        delta, total = x_mean - mean, n + k
+        mean += delta * k / total
+        m2 += np.square(x - x_mean).sum() + delta ** 2 * n * k / total
+        n = total
+    if n == 0:
+        return 0, np.nan, np.nan
+    return n, mean, np.sqrt(m2 / n)
+
 
-    return pd.DataFrame(joined)
+def iter_fused_chunks(path, ds_mean, variables, mode=None, radius_km=MERRA_RADIUS_KM, chunk_rows=None,
+                      anomaly_mode=None, climatology=None):
+    """Stream a granule through anomaly flagging and MERRA-2 fusion, one block at a time.
+
+    Two passes over the file: the first gathers the NO2 mean/std for the granule z-score
+    (and, in "local" anomaly mode, the per-cell sums for the moving-window background),
+    the second yields fused DataFrames. Memory stays bounded by the reader block size.
+    In "climatology" mode pixels are scored against climatology (the history before
+    this granule).
+    """
+    mode = mode or MERRA_FUSE_MODE
+    anomaly_mode = anomaly_mode or config.ANOMALY_MODE
+    if anomaly_mode not in ("global", "local", "climatology"):
+        raise ValueError(f"Unsupported anomaly mode: {anomaly_mode!r}")
+    if anomaly_mode == "climatology" and climatology is None:
+        climatology = Climatology()
+    background = LocalBackground() if anomaly_mode == "local" else None
+
+    def first_pass():
+        for chunk in iter_tempo_chunks(path, chunk_rows=chunk_rows):
+            if background is not None:
+                background.add(chunk["lat"], chunk["lon"], chunk["NO2"])
+            yield chunk
+
+    _, mean, std = no2_moments(first_pass())
+    if background is not None:
+        background.finalize()
+    df_merra = index = None
+    if mode == "kdtree":
+        df_merra = merra_to_frame(ds_mean)
+        index = SphericalIndex.cached(df_merra["lat"].values, df_merra["lon"].values)
+
+    for chunk in iter_tempo_chunks(path, chunk_rows=chunk_rows):
+        tempo_df = chunk_to_frame(chunk)
+        if anomaly_mode == "climatology":
+            z = climatology.zscore(chunk["lat"], chunk["lon"], chunk["NO2"])
+        elif background is not None:
+            z = background.zscore(chunk["lat"], chunk["lon"], chunk["NO2"])
+        else:
+            z = (tempo_df["NO2"].to_numpy(dtype=np.float64) - mean) / std if std > 0 else 0.0
+        tempo_df["NO2_z"] = z
+        tempo_df["anomaly_flag"] = np.where(tempo_df["NO2_z"] > config.Z_CUTOFF, 1, 0)
+        if mode == "kdtree":
+            fused = fast_spatial_fuse(tempo_df, df_merra, "lat", "lon", "lat", "lon",
+                                      radius_km=radius_km, index=index)
+        else:
+            fused = grid_fuse(tempo_df, ds_mean, variables, method=mode)
+        if len(fused):
+            yield fused
+
+
+# ============================================================
+# 5. Outputs
+# ============================================================
+def write_outputs(fused, variables, part="fused", time=None, store=None, json_out=config.FUSED_JSON):
+    """Write the fused frame into the columnar store, then refresh the frontend JSON view."""
+    store = store or FusedStore()
+    store.drop(part)
+    store.write_part(fused, part, time=time)
+    if json_out:
+        refresh_json_view(store, variables, json_out)
+
+
+def refresh_json_view(store, variables, json_out=config.FUSED_JSON):
+    """Rewrite the frontend JSON view (/api/data) from the newest granule in the store."""
+    return export_json_view(store, json_out, variables, start=store.latest_time())
 
-# Perform fusion
-fused = fast_spatial_fuse(tempo_df, df_merra, "lat", "lon", "lat", "lon", radius_km=400)
 
 # ============================================================
-# 5. Save outputs (CSV + JSON)
+# 6. Incremental multi-granule runs
 # ============================================================
-if len(fused) > 0:
-    CSV_OUT = "./data/fused_data.csv"
-    JSON_OUT = "./data/fused_data.json"
-
-    fused.to_csv(CSV_OUT, index=False)
-
-    geojson_like = []
-    for _, row in fused.iterrows():
-        geojson_like.append({
-            "lat": float(row["lat"]),
-            "lon": float(row["lon"]),
-            "NO2": float(row.get("NO2", 0)),
-            "anomaly_flag": int(row.get("anomaly_flag", 0)),
-            **{k: float(row[k]) for k in df_merra.columns if k in fused.columns and pd.notna(row[k])}
-        })
-
-    pd.Series(geojson_like).to_json(JSON_OUT, orient="records", indent=2)
-    print(f"✅ Fusion complete. Saved {len(fused)} fused records to CSV + JSON.")
-else:
-    print("⚠️ No overlapping spatial data found. Try increasing radius_km.")
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a granule file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"files": {}, "granules": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    """Write the manifest atomically so an interrupted run never corrupts it."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _granule_hash(path, manifest):
+    """sha256 of path, reusing the manifest entry while size and mtime are unchanged."""
+    st = os.stat(path)
+    name = os.path.basename(path)
+    seen = manifest["files"].get(name)
+    if seen and seen["size"] == st.st_size and seen["mtime_ns"] == st.st_mtime_ns:
+        return seen["sha256"]
+    digest = file_sha256(path)
+    manifest["files"][name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return digest
+
+
+def pending_granules(granule_dir, pattern, manifest):
+    """(path, digest) of every granule whose content is not in the manifest yet."""
+    pending = []
+    for path in sorted(glob(os.path.join(granule_dir, pattern))):
+        digest = _granule_hash(path, manifest)
+        if digest not in manifest["granules"]:
+            pending.append((path, digest))
+    return pending
+
+
+def fuse_to_store(path, ds_mean, variables, store, cells, mode=None, climatology=None,
+                  anomaly_mode=None):
+    """Fuse one granule into the store, replacing the parts of any earlier run of it.
+
+    Each reader block becomes one store part per tile ("<granule stem>-NNNN"); the
+    fused NO2 is also added to cells (climatology.GranuleCells). Returns (rows, parts).
+    """
+    stamp = parse_granule_time(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    store.drop(stem)
+    rows, parts = 0, []
+    for seq, fused in enumerate(iter_fused_chunks(path, ds_mean, variables, mode=mode,
+                                                  anomaly_mode=anomaly_mode, climatology=climatology)):
+        parts.extend(store.write_part(fused, f"{stem}-{seq:04d}", time=stamp))
+        cells.add(fused["lat"].values, fused["lon"].values, fused["NO2"].values)
+        rows += len(fused)
+    return rows, parts
+
+
+def record_granule(manifest, manifest_path, path, digest, rows, parts):
+    """Replace the granule's manifest entry (a changed granule drops its old one) and save."""
+    name = os.path.basename(path)
+    manifest["granules"] = {k: v for k, v in manifest["granules"].items() if v["name"] != name}
+    manifest["granules"][digest] = {
+        "name": name,
+        "part": os.path.splitext(name)[0],
+        "partitions": len(parts),
+        "rows": rows,
+        "processed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    save_manifest(manifest, manifest_path)
+    print(f"✅ Fused {name}: {rows} records -> {len(parts)} store partitions")
+
+
+def run_incremental(granule_dir=config.TEMPO_DIR, merra_path=config.MERRA_PATH_PATTERN,
+                    store_dir=config.FUSED_STORE_DIR, manifest_path=None,
+                    pattern="TEMPO_*.nc", mode=None, climatology=None, series=None,
+                    json_out=config.FUSED_JSON):
+    """Fuse every new or changed granule in granule_dir and record it in the manifest.
+
+    merra_path may contain a {date} field (e.g. "MERRA2_{date:%Y%m%d}.nc4") to pick
+    the MERRA-2 day matching each granule. Every fused granule is also folded into the
+    per-cell NO2 climatology (idempotent per granule content) and the per-cell time
+    series. The tile pyramid (for the dates fused) and the JSON view (json_out, newest
+    granule) are refreshed once at the end.
+    Returns the partition directories written. See parallel_fusion.run_parallel for
+    the multi-process version.
+    """
+    store = FusedStore(store_dir)
+    climatology = climatology or Climatology()
+    series = series or TimeSeriesStore()
+    manifest_path = manifest_path or os.path.join(store_dir, "manifest.json")
+    manifest = load_manifest(manifest_path)
+    merra_cache = {}
+    written, days = [], set()
+
+    for path, digest in pending_granules(granule_dir, pattern, manifest):
+        days.add(f"{parse_granule_time(path):%Y-%m-%d}")
+        merra_file = merra_path.format(date=parse_granule_time(path))
+        if merra_file not in merra_cache:
+            merra_cache[merra_file] = load_merra(merra_file)
+        ds_mean, variables = merra_cache[merra_file]
+
+        cells = climatology.new_granule()
+        rows, parts = fuse_to_store(path, ds_mean, variables, store, cells, mode=mode,
+                                    climatology=climatology)
+        written.extend(parts)
+        climatology.apply(os.path.splitext(os.path.basename(path))[0], cells, digest=digest)
+        series.record(store, parse_granule_time(path), parts)
+        record_granule(manifest, manifest_path, path, digest, rows, parts)
+
+    save_manifest(manifest, manifest_path)
+    if days:
+        refresh_pyramid(store, sorted(days))
+    if written and json_out:
+        variables = list(dict.fromkeys(v for _, names in merra_cache.values() for v in names))
+        refresh_json_view(store, variables, json_out)
+    return written
+
+
+def main():
+    print("🚀 Starting ADIS Fusion Pipeline...")
+
+    print("\n📂 Loading MERRA-2 dataset...")
+    ds_mean, available_vars = load_merra("./data/MERRA2_20240410.nc4")
+    if MERRA_FUSE_MODE == "kdtree":
+        merra_to_frame(ds_mean).to_csv("./data/cleaned_merra2.csv", index=False)
+    print(f"✅ Loaded MERRA-2 variables: {available_vars}")
+
+    print("\n📡 Loading TEMPO dataset...")
+    tempo_path = "./data/tempo/TEMPO_NO2_L2_V03_20250406T215103Z_S012G07.nc"
+    tempo_df = load_tempo(tempo_path)
+    print(f"✅ TEMPO dataset processed: {len(tempo_df)} valid points")
+    tempo_df = flag_anomalies(tempo_df)
+
+    print("\n🌍 Loading OpenAQ dataset...")
+    openaq_df = load_openaq()
+
+    print("\n🔗 Fusing datasets (spatial proximity join)...")
+    fused = fuse_granule(tempo_df, ds_mean, available_vars)
+
+    if len(fused) > 0:
+        write_outputs(fused, available_vars, part=os.path.splitext(os.path.basename(tempo_path))[0],
+                      time=parse_granule_time(tempo_path))
+        print(f"✅ Fusion complete. Saved {len(fused)} fused records to the store + JSON view.")
+
+        print("\n📏 Validating TEMPO against OpenAQ NO2 stations...")
+        matches, stats = validate_against_stations(openaq_df)
+        if len(matches):
+            overall = collocation_stats(matches, by=None).iloc[0]
+            print(f"✅ {len(stats)} stations matched ({len(matches)} readings): "
+                  f"bias {overall['bias_ppb']:.2f} ppb, r = {overall['r']:.2f}")
+        else:
+            print("⚠️ No station readings fall within the collocation window.")
+    else:
+        print("⚠️ No overlapping spatial data found. Try increasing radius_km.")
+
+
+if __name__ == "__main__":
+    main()
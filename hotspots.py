@@ -0,0 +1,140 @@
+# hotspots.py
+# --------------------------------------------
+# Connected-component hotspot extraction for ADIS
+# Anomaly pixels are reduced chunk by chunk to per-cell sums on a regular
+# HOTSPOT_CELL_DEG grid (count, NO2 sum / max, lat / lon sums, signature
+# counts). Occupied cells are then labelled as 8-connected components
+# with scipy.ndimage over the occupied extent, which is linear in the grid
+# size, and each component becomes one hotspot: centroid, peak, area,
+# mean NO2 and dominant source signature.
+# --------------------------------------------
+
+import numpy as np
+from scipy import ndimage
+
+import backend.config as config
+from backend.signature import classify_signatures
+
+_EIGHT = np.ones((3, 3), dtype=bool)
+
+
+def _signature_labels():
+    return list(dict.fromkeys([label for label, _ in config.SIGNATURE_RULES] + [config.SIGNATURE_DEFAULT]))
+
+
+class HotspotGrid:
+    """Per-cell anomaly sums, accumulated with add() and clustered with clusters()."""
+
+    def __init__(self, cell_deg=None):
+        self.cell_deg = cell_deg or config.HOTSPOT_CELL_DEG
+        self.ncols = int(np.ceil(360.0 / self.cell_deg))
+        self.labels = _signature_labels()
+        self._parts = []
+
+    @classmethod
+    def from_store(cls, store, bbox=None, start=None, end=None, cell_deg=None):
+        grid = cls(cell_deg)
+        rule_cols = [col for _, conditions in config.SIGNATURE_RULES for col, _, _ in conditions]
+        columns = list(dict.fromkeys([config.LAT_COL, config.LON_COL, config.NO2_COL, config.ANOM_COL] + rule_cols))
+        for chunk in store.iter_parts(columns, bbox=bbox, start=start, end=end):
+            grid.add(chunk)
+        return grid
+
+    def add(self, df):
+        """Reduce the anomaly pixels of one chunk to per-cell sums."""
+        df = df[df[config.ANOM_COL].to_numpy() == 1]
+        no2 = df[config.NO2_COL].to_numpy(dtype=np.float64)
+        ok = np.isfinite(no2)
+        if not ok.any():
+            return self
+        df, no2 = df[ok], no2[ok]
+        lat = df[config.LAT_COL].to_numpy(dtype=np.float64)
+        lon = df[config.LON_COL].to_numpy(dtype=np.float64)
+        row = np.floor((lat + 90.0) / self.cell_deg).astype(np.int64)
+        col = np.clip(np.floor((lon + 180.0) / self.cell_deg).astype(np.int64), 0, self.ncols - 1)
+        ids, inv = np.unique(row * self.ncols + col, return_inverse=True)
+        k = len(ids)
+
+        # Peak pixel per cell: last of each run once sorted by (cell, NO2)
+        order = np.lexsort((no2, inv))
+        last = np.r_[np.flatnonzero(inv[order][1:] != inv[order][:-1]), len(order) - 1]
+        peak = order[last]
+
+        sig = classify_signatures(df).codes.astype(np.int64)
+        sig_counts = np.bincount(inv * len(self.labels) + sig, minlength=k * len(self.labels))
+        self._parts.append({
+            "ids": ids,
+            "count": np.bincount(inv, minlength=k),
+            "no2_sum": np.bincount(inv, weights=no2, minlength=k),
+            "lat_sum": np.bincount(inv, weights=lat, minlength=k),
+            "lon_sum": np.bincount(inv, weights=lon, minlength=k),
+            "peak": no2[peak], "peak_lat": lat[peak], "peak_lon": lon[peak],
+            "sig": sig_counts.reshape(k, len(self.labels)),
+        })
+        return self
+
+    def _cells(self):
+        """Merge chunk parts into one record per occupied cell."""
+        cat = {key: np.concatenate([p[key] for p in self._parts]) for key in self._parts[0]}
+        ids, inv = np.unique(cat["ids"], return_inverse=True)
+        k = len(ids)
+        cells = {"ids": ids}
+        for key in ("count", "no2_sum", "lat_sum", "lon_sum"):
+            cells[key] = np.bincount(inv, weights=cat[key], minlength=k)
+        order = np.lexsort((cat["peak"], inv))
+        last = order[np.r_[np.flatnonzero(inv[order][1:] != inv[order][:-1]), len(order) - 1]]
+        for key in ("peak", "peak_lat", "peak_lon"):
+            cells[key] = cat[key][last]
+        sig = np.zeros((k, len(self.labels)))
+        np.add.at(sig, inv, cat["sig"])
+        cells["sig"] = sig
+        return cells
+
+    def clusters(self, min_pixels=None):
+        """One dict per 8-connected cluster of occupied cells, largest peak first."""
+        min_pixels = config.HOTSPOT_MIN_PIXELS if min_pixels is None else min_pixels
+        if not self._parts:
+            return []
+        cells = self._cells()
+        rows, cols = cells["ids"] // self.ncols, cells["ids"] % self.ncols
+        r0, c0 = rows.min(), cols.min()
+        mask = np.zeros((rows.max() - r0 + 1, cols.max() - c0 + 1), dtype=bool)
+        mask[rows - r0, cols - c0] = True
+        labelled, n = ndimage.label(mask, structure=_EIGHT)
+        label = labelled[rows - r0, cols - c0] - 1
+
+        count = np.bincount(label, weights=cells["count"], minlength=n)
+        no2_sum = np.bincount(label, weights=cells["no2_sum"], minlength=n)
+        lat_sum = np.bincount(label, weights=cells["lat_sum"], minlength=n)
+        lon_sum = np.bincount(label, weights=cells["lon_sum"], minlength=n)
+        n_cells = np.bincount(label, minlength=n)
+        cell_lat = (rows + 0.5) * self.cell_deg - 90.0
+        km = self.cell_deg / config.DEG_PER_KM
+        area = np.bincount(label, weights=km * km * np.cos(np.deg2rad(cell_lat)), minlength=n)
+        sig = np.zeros((n, len(self.labels)))
+        np.add.at(sig, label, cells["sig"])
+        order = np.lexsort((cells["peak"], label))
+        peak = order[np.r_[np.flatnonzero(label[order][1:] != label[order][:-1]), len(order) - 1]]
+
+        out = []
+        for i in np.flatnonzero(count >= max(min_pixels, 1)):
+            p = peak[i]
+            out.append({
+                "id": int(i),
+                "lat": float(lat_sum[i] / count[i]),
+                "lon": float(lon_sum[i] / count[i]),
+                "pixels": int(count[i]),
+                "cells": int(n_cells[i]),
+                "area_km2": float(area[i]),
+                "no2_mean": float(no2_sum[i] / count[i]),
+                "peak": {"lat": float(cells["peak_lat"][p]), "lon": float(cells["peak_lon"][p]),
+                         "no2": float(cells["peak"][p])},
+                "signature": self.labels[int(np.argmax(sig[i]))],
+            })
+        out.sort(key=lambda h: h["peak"]["no2"], reverse=True)
+        return out
+
+
+def extract_hotspots(df, cell_deg=None, min_pixels=None):
+    """Hotspot clusters of the anomaly pixels in one DataFrame."""
+    return HotspotGrid(cell_deg).add(df).clusters(min_pixels)
@@ -0,0 +1,71 @@
+# jobs.py
+# --------------------------------------------
+# Background jobs for long-running ADIS API requests
+# A small thread pool runs expensive builds (plume forecasts) off the
+# request thread. Jobs are deduplicated by key, so concurrent identical
+# requests share one run, and only the most recent finished jobs are kept.
+# --------------------------------------------
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueue:
+    """Submit fn() under a key; poll by job id."""
+
+    def __init__(self, max_workers=2, keep_finished=256):
+        self.keep_finished = keep_finished
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adis-job")
+        self._jobs = OrderedDict()      # job_id -> job dict
+        self._active = {}               # key -> job_id of a pending/running job
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn):
+        """Queue fn() unless a job for key is already pending or running. Returns the job dict."""
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return self._jobs[job_id]
+            job = {"id": uuid.uuid4().hex, "key": key, "status": "pending",
+                   "submitted": time.time(), "result": None, "error": None,
+                   "event": threading.Event()}
+            self._jobs[job["id"]] = job
+            self._active[key] = job["id"]
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job["status"] = "running"
+        try:
+            job["result"] = fn()
+            job["status"] = "done"
+        except Exception as e:  # reported to the polling client
+            job["error"] = str(e)
+            job["status"] = "error"
+        finally:
+            job["finished"] = time.time()
+            job["event"].set()
+            with self._lock:
+                self._active.pop(job["key"], None)
+                self._trim()
+
+    def _trim(self):
+        finished = [jid for jid, j in self._jobs.items() if j["status"] in ("done", "error")]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    @staticmethod
+    def wait(job, timeout):
+        """Block up to timeout seconds for job to finish; True if it did."""
+        return job["event"].wait(timeout)
+
+    @staticmethod
+    def describe(job):
+        """JSON-safe status of a job."""
+        return {k: job[k] for k in ("id", "status", "submitted", "error")}
@@ -0,0 +1,92 @@
+# nearest.py
+# --------------------------------------------
+# Batched point lookups over the fused store for ADIS
+# The newest granule's fused pixels (optionally NEAREST_HOURS of history
+# before it) are loaded once per store version into a SphericalIndex (unit-sphere KD-tree); many query points
+# are then answered per call: nearest, k-nearest (optionally within a
+# maximum distance) or every pixel within a radius.
+# --------------------------------------------
+
+import numpy as np
+import pandas as pd
+
+import backend.config as config
+from backend.fused_store import TIME_COL
+from backend.spatial_index import SphericalIndex
+
+
+class PointLookup:
+    """Values of the fused pixels nearest to many query points at once."""
+
+    def __init__(self, df, version=None):
+        df = df.dropna(subset=[config.LAT_COL, config.LON_COL]).reset_index(drop=True)
+        self.version = version
+        self.columns = {col: df[col].to_numpy() for col in df.columns}
+        self.index = SphericalIndex(df[config.LAT_COL].to_numpy(), df[config.LON_COL].to_numpy())
+
+    @classmethod
+    def from_store(cls, store, hours=None, columns=None):
+        """Index the newest granule's pixels, plus `hours` of older ones (default NEAREST_HOURS).
+
+        With hours > 0 a point covered by the newest granule can still match an older pixel.
+        """
+        hours = config.NEAREST_HOURS if hours is None else hours
+        columns = list(dict.fromkeys([config.LAT_COL, config.LON_COL, TIME_COL]
+                                     + list(config.NEAREST_COLUMNS if columns is None else columns)))
+        version = store.version()
+        latest = store.latest_time()
+        start = None if latest is None else latest - pd.Timedelta(hours=hours)
+        return cls(store.read(columns=columns, start=start), version=version)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _records(self, idx, dist):
+        out = {"lat": self.index.lat[idx], "lon": self.index.lon[idx], "distance_km": dist}
+        for col, values in self.columns.items():
+            if col not in (config.LAT_COL, config.LON_COL):
+                out[col] = values[idx]
+        return out
+
+    def nearest(self, lat, lon, k=1, max_km=np.inf):
+        """k nearest pixels per query point: dict of (n_points, k) arrays plus a `found` mask."""
+        k = max(1, min(int(k), len(self)))
+        dist, idx = self.index.query(lat, lon, k=k, max_km=max_km)
+        dist, idx = dist.reshape(len(dist), k), idx.reshape(len(idx), k)
+        found = idx < len(self)
+        out = self._records(np.where(found, idx, 0), dist)
+        out["found"] = found
+        return out
+
+    @staticmethod
+    def jsonable(values):
+        """Plain Python list for JSON: ISO strings for times, None for NaN / NaT."""
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.datetime64):
+            stamps = pd.DatetimeIndex(values.ravel())
+            text = np.where(stamps.isna(), None, stamps.strftime("%Y-%m-%dT%H:%M:%SZ"))
+            return text.reshape(values.shape).tolist()
+        if np.issubdtype(values.dtype, np.floating):
+            return np.where(np.isfinite(values), values.astype(object), None).tolist()
+        return values.tolist()
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """Every pixel within radius_km of each query point, nearest first.
+
+        Returns (point_ids, records): one flat record per match, point_ids saying which
+        query point it belongs to. limit caps matches per point.
+        """
+        lists = self.index.query_ball(lat, lon, radius_km)
+        counts = np.fromiter((len(m) for m in lists), dtype=np.int64, count=len(lists))
+        point_ids = np.repeat(np.arange(len(lists)), counts)
+        idx = np.fromiter((i for m in lists for i in m), dtype=np.int64, count=int(counts.sum()))
+        dist = self.index.distance_km(np.asarray(lat, dtype=float)[point_ids],
+                                      np.asarray(lon, dtype=float)[point_ids], idx)
+        order = np.lexsort((dist, point_ids))
+        point_ids, idx, dist = point_ids[order], idx[order], dist[order]
+        if limit is not None:
+            starts = np.r_[0, np.cumsum(counts)][:-1]
+            rank = np.arange(len(point_ids)) - np.repeat(starts, counts)
+            keep = rank < limit
+            point_ids, idx, dist = point_ids[keep], idx[keep], dist[keep]
+        return point_ids, self._records(idx, dist)
@@ -1,9 +1,13 @@
 # openaq_fetch.py
 # ✅ Fetch worldwide current air quality data (OpenAQ v3, updated October 2025)
 
+import sys
+
 import requests
 import pandas as pd
 
+import backend.config as config
+
 print("🌍 Fetching worldwide current air quality data (OpenAQ v3)...")
 
 BASE_URL = "https://api.openaq.org/v3/locations"
@@ -11,6 +15,14 @@ BASE_URL = "https://api.openaq.org/v3/locations"
 # 🔑 Replace with your real API key from https://api.openaq.org/dashboard
 API_KEY = "e212a4c9ff259a153c36ea1e10a180ca227dfaecc12e006b738c606664561aba"
 
+# Incremental mode: python openaq_fetch.py --sync  (see openaq_sync.py)
+if "--sync" in sys.argv:
+    from backend.openaq_sync import OpenAQClient, sync
+    summary = sync(OpenAQClient(api_key=API_KEY), sort="desc", order_by="id")
+    print(f"✅ Synced {summary['fetched']} locations ({summary['changed']} changed), "
+          f"{summary['rows']} rows in {config.OPENAQ_LONG_CSV}")
+    exit()
+
 # Request parameters (adjust as needed)
 params = {
     "limit": 1000,
@@ -0,0 +1,194 @@
+# openaq_sync.py
+# --------------------------------------------
+# Incremental OpenAQ v3 sync for ADIS
+# Pages of /v3/locations are fetched concurrently over one pooled
+# session, pausing on the x-ratelimit-* headers and backing off on 429 /
+# 5xx. Every parameter of every location is kept in long format
+# (one row per location x parameter). A per-location fingerprint of the
+# latest readings is saved in the sync state, so a run only rewrites
+# the rows of locations whose measurements changed.
+#
+#   python -m backend.openaq_sync        (API key from $OPENAQ_API_KEY)
+# --------------------------------------------
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import backend.config as config
+
+LONG_COLUMNS = ["location_id", "location", "city", "country", "latitude", "longitude",
+                "parameter", "value", "unit", "time"]
+
+
+class RateLimiter:
+    """Shared view of the API's rate-limit headers; callers wait while the quota is spent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, headers):
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is not None and reset is not None and int(float(remaining)) <= 0:
+            self.pause(float(reset))
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+class OpenAQClient:
+    """Thread-safe /v3 client over one pooled Session."""
+
+    def __init__(self, api_key=None, base_url=None, workers=None, max_retries=5, timeout=30):
+        self.base_url = (base_url or config.OPENAQ_BASE_URL).rstrip("/")
+        self.workers = workers or config.OPENAQ_WORKERS
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = RateLimiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        api_key = api_key or os.environ.get("OPENAQ_API_KEY")
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+
+    def get(self, path, params):
+        """GET with rate-limit pauses and exponential backoff on 429 / 5xx."""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            resp = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            self.limiter.update(resp.headers)
+            if resp.status_code == 429 or resp.status_code >= 500:
+                retry_after = resp.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after else min(60.0, 2 ** attempt) + random.random()
+                self.limiter.pause(delay)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+        raise requests.HTTPError(f"{path} still failing after {self.max_retries} retries")
+
+    def locations(self, limit=1000, max_pages=None, **params):
+        """Every /locations result, fetching `workers` pages at a time until a short page."""
+        results, page = [], 1
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="openaq") as pool:
+            while max_pages is None or page <= max_pages:
+                wave = range(page, page + self.workers if max_pages is None
+                             else min(page + self.workers, max_pages + 1))
+                pages = list(pool.map(lambda p: self.get("/locations", {**params, "limit": limit, "page": p})
+                                      .get("results", []), wave))
+                for rows in pages:
+                    results.extend(rows)
+                if any(len(rows) < limit for rows in pages):
+                    break
+                page += len(wave)
+        return results
+
+
+# === Flattening ===
+
+def measurements_long(locations):
+    """One row per (location, parameter) from /locations results."""
+    rows = []
+    for loc in locations:
+        coords = loc.get("coordinates") or {}
+        base = {
+            "location_id": loc.get("id"),
+            "location": loc.get("name"),
+            "city": loc.get("city") or loc.get("locality"),
+            "country": (loc.get("country") or {}).get("code") if isinstance(loc.get("country"), dict)
+            else loc.get("country"),
+            "latitude": coords.get("latitude"),
+            "longitude": coords.get("longitude"),
+        }
+        for p in loc.get("parameters") or []:
+            rows.append({
+                **base,
+                "parameter": p.get("parameter"),
+                "value": p.get("value", p.get("lastValue")),
+                "unit": p.get("unit"),
+                "time": p.get("lastUpdated"),
+            })
+    return pd.DataFrame(rows, columns=LONG_COLUMNS)
+
+
+def location_fingerprints(long_df):
+    """location_id -> fingerprint of its (parameter, value, unit, time) readings.
+
+    Row hashes are summed per location (order-independent), so this stays vectorized.
+    """
+    cols = ["parameter", "value", "unit", "time"]
+    rows = pd.util.hash_pandas_object(long_df[cols].astype(str), index=False).to_numpy()
+    sums = pd.Series(rows, index=long_df["location_id"].astype(str).to_numpy()).groupby(level=0).sum()
+    return {loc: f"{int(h) & 0xFFFFFFFFFFFFFFFF:016x}" for loc, h in sums.items()}
+
+
+# === State + upsert ===
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {"last_sync": None, "locations": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_atomic(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def sync(client=None, table_path=None, state_path=None, **params):
+    """Fetch all locations and upsert rows of the locations whose readings changed.
+
+    Returns a summary dict (locations fetched, locations changed, rows in the table).
+    """
+    client = client or OpenAQClient()
+    table_path = table_path or config.OPENAQ_LONG_CSV
+    state_path = state_path or config.OPENAQ_STATE
+    state = load_state(state_path)
+
+    fresh = measurements_long(client.locations(**params))
+    fresh["location_id"] = fresh["location_id"].astype(str)
+    prints = location_fingerprints(fresh)
+    changed = {loc for loc, fp in prints.items() if state["locations"].get(loc) != fp}
+
+    if os.path.exists(table_path):
+        table = pd.read_csv(table_path, dtype={"location_id": str})
+        table = table[~table["location_id"].isin(changed)]
+        table = pd.concat([table, fresh[fresh["location_id"].isin(changed)]], ignore_index=True)
+    else:
+        table = fresh
+    if changed or not os.path.exists(table_path):
+        _write_atomic(table, table_path)
+
+    state["locations"].update(prints)
+    state["last_sync"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{state_path}.tmp", state_path)
+    return {"fetched": len(prints), "changed": len(changed), "rows": len(table)}
+
+
+if __name__ == "__main__":
+    summary = sync()
+    print(f"✅ OpenAQ sync: {summary['fetched']} locations, {summary['changed']} changed, "
+          f"{summary['rows']} rows -> {config.OPENAQ_LONG_CSV}")
@@ -0,0 +1,170 @@
+# parallel_fusion.py
+# --------------------------------------------
+# Process-pool fusion of many TEMPO granules for ADIS
+# The parent loads each needed MERRA-2 day once and copies its daily-mean
+# fields into shared memory; workers attach to those blocks (no pickling
+# of the grids) and fuse whole granules into the store independently.
+# The parent alone updates the manifest and the climatology, merging the
+# small per-granule cell moments each worker returns.
+# --------------------------------------------
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import backend.config as config
+from backend import fusion_pipeline as fp
+from backend.climatology import CellGrid, Climatology, GranuleCells
+from backend.fused_store import FusedStore
+from backend.regrid import GridFields
+from backend.tile_pyramid import refresh_pyramid
+from backend.timeseries import TimeSeriesStore
+from backend.utils import parse_granule_time
+
+# Per-worker state, set by _init_worker
+_WORKER = {}
+
+
+# ============================================================
+# Shared-memory MERRA-2 grids
+# ============================================================
+def share_grid(grid):
+    """Copy GridFields arrays into shared memory. Returns (descriptor, SharedMemory blocks)."""
+    blocks, fields = [], {}
+    for var, arr in grid.fields.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        fields[var] = {"shm": shm.name, "shape": arr.shape, "dtype": arr.dtype.str}
+    return {"fields": fields, "axes": grid.axes}, blocks
+
+
+def attach_grid(descriptor):
+    """GridFields view over shared-memory blocks. Returns (grid, blocks to keep alive)."""
+    blocks, fields = [], {}
+    for var, d in descriptor["fields"].items():
+        shm = shared_memory.SharedMemory(name=d["shm"])
+        blocks.append(shm)
+        fields[var] = np.ndarray(d["shape"], dtype=np.dtype(d["dtype"]), buffer=shm.buf)
+    return GridFields(fields, descriptor["axes"]), blocks
+
+
+def _init_worker(grids, store_dir, clim_grid, clim_root, anomaly_mode):
+    _WORKER["grids"] = {}
+    _WORKER["blocks"] = []
+    for key, (descriptor, variables) in grids.items():
+        grid, blocks = attach_grid(descriptor)
+        _WORKER["grids"][key] = (grid, variables)
+        _WORKER["blocks"].extend(blocks)
+    _WORKER["store"] = FusedStore(store_dir)
+    _WORKER["cell_grid"] = CellGrid(*clim_grid)
+    _WORKER["anomaly_mode"] = anomaly_mode
+    # Scoring against history only reads the climatology arrays
+    _WORKER["climatology"] = Climatology(clim_root, readonly=True) if anomaly_mode == "climatology" else None
+
+
+def _fuse_worker(path, merra_key, mode):
+    grid, variables = _WORKER["grids"][merra_key]
+    cells = GranuleCells(_WORKER["cell_grid"])
+    rows, parts = fp.fuse_to_store(path, grid, variables, _WORKER["store"], cells, mode=mode,
+                                   climatology=_WORKER["climatology"],
+                                   anomaly_mode=_WORKER["anomaly_mode"])
+    return rows, parts, cells.moments(), cells.pixels
+
+
+def _commit_granule(manifest, manifest_path, climatology, series, store, path, digest, rows, parts,
+                    moments, pixels):
+    cells = GranuleCells.from_moments(climatology.grid, moments, pixels)
+    climatology.apply(os.path.splitext(os.path.basename(path))[0], cells, digest=digest)
+    series.record(store, parse_granule_time(path), parts)
+    fp.record_granule(manifest, manifest_path, path, digest, rows, parts)
+
+
+# ============================================================
+# Runner
+# ============================================================
+def run_parallel(granule_dir=config.TEMPO_DIR, merra_path=config.MERRA_PATH_PATTERN,
+                 store_dir=config.FUSED_STORE_DIR, manifest_path=None, pattern="TEMPO_*.nc",
+                 mode=None, workers=None, climatology=None, series=None,
+                 json_out=config.FUSED_JSON):
+    """Multi-process run_incremental: same manifest, store, climatology, series, tile and JSON updates.
+
+    Only the grid MERRA-2 modes ("bilinear" / "nearest") are supported; they need no
+    spatial index. In "climatology" anomaly mode, granules are scored against the
+    history as it stood before this run (run_incremental scores each one against
+    the granules fused before it, so flags can differ from a sequential run).
+    A granule that fails does not stop the others from being committed; the
+    failures are raised together once the successful ones are recorded.
+    """
+    mode = mode or fp.MERRA_FUSE_MODE
+    if mode == "kdtree":
+        raise ValueError("run_parallel supports the grid MERRA-2 modes only; use run_incremental")
+    workers = workers or config.FUSION_WORKERS or os.cpu_count()
+    climatology = climatology or Climatology()
+    series = series or TimeSeriesStore()
+    store = FusedStore(store_dir)
+    manifest_path = manifest_path or os.path.join(store_dir, "manifest.json")
+    manifest = fp.load_manifest(manifest_path)
+
+    pending = fp.pending_granules(granule_dir, pattern, manifest)
+    if not pending:
+        return []
+
+    # Each MERRA-2 day is read once here and shared with every worker
+    grids, blocks, tasks = {}, [], []
+    try:
+        for path, digest in pending:
+            merra_file = merra_path.format(date=parse_granule_time(path))
+            if merra_file not in grids:
+                ds_mean, variables = fp.load_merra(merra_file)
+                descriptor, shm = share_grid(GridFields.from_dataset(ds_mean, variables))
+                grids[merra_file] = (descriptor, variables)
+                blocks.extend(shm)
+            tasks.append((path, digest, merra_file))
+
+        written, failed = [], []
+        init_args = (grids, store_dir, (climatology.grid.cell_deg, climatology.grid.bounds),
+                     climatology.root, config.ANOMALY_MODE)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=init_args) as pool:
+            futures = {pool.submit(_fuse_worker, path, merra_file, mode): (path, digest)
+                       for path, digest, merra_file in tasks}
+            # Workers scoring against the climatology must not see it change mid-run,
+            # so in that mode every update waits for the pool to finish
+            deferred = []
+            for future in as_completed(futures):
+                try:
+                    result = futures[future] + future.result()
+                except Exception as e:
+                    failed.append((futures[future][0], e))
+                    print(f"⚠️ Fusing {os.path.basename(futures[future][0])} failed: {e}")
+                    continue
+                written.extend(result[3])
+                if config.ANOMALY_MODE == "climatology":
+                    deferred.append(result)
+                else:
+                    _commit_granule(manifest, manifest_path, climatology, series, store, *result)
+        for result in deferred:
+            _commit_granule(manifest, manifest_path, climatology, series, store, *result)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    fp.save_manifest(manifest, manifest_path)
+    refresh_pyramid(store, sorted({f"{parse_granule_time(path):%Y-%m-%d}" for path, _, _ in tasks}))
+    if written and json_out:
+        variables = list(dict.fromkeys(v for _, names in grids.values() for v in names))
+        fp.refresh_json_view(store, variables, json_out)
+    if failed:
+        names = ", ".join(os.path.basename(path) for path, _ in failed)
+        raise RuntimeError(f"{len(failed)} granule(s) failed to fuse: {names}") from failed[0][1]
+    return written
+
+
+if __name__ == "__main__":
+    out = run_parallel()
+    print(f"✅ Parallel fusion wrote {len(out)} store partitions")
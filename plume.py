@@ -9,35 +9,112 @@ import backend.config as config
 EARTH_RADIUS_M = 6_371_000.0
 DEG_PER_M_LAT  = 1.0 / 111_000.0
 
-def step_latlon(lat, lon, u_ms, v_ms, dt_sec):
-    dlat = (v_ms * dt_sec) * DEG_PER_M_LAT
-    coslat = max(0.1, np.cos(np.deg2rad(lat)))
-    dlon = (u_ms * dt_sec) * (DEG_PER_M_LAT / coslat)
-    return lat + dlat, lon + dlon
-
-def random_diffusion(lat, lon, dt_hours, sigma_km):
-    sigma_deg = sigma_km * 0.009
-    return lat + np.random.randn() * sigma_deg * np.sqrt(dt_hours), \
-           lon + np.random.randn() * sigma_deg * np.sqrt(dt_hours)
-
-def plume_trajectories(df: pd.DataFrame, hours=6, dt_minutes=10) -> List[Dict]:
-    out = []
+def _constant_wind(u_ms, v_ms):
+    def wind(lat, lon, t_sec):
+        return np.full(lat.shape, float(u_ms)), np.full(lat.shape, float(v_ms))
+    return wind
+
+
+def _velocity_deg(wind, lat, lon, t_sec):
+    """Wind at each particle as (dlat/dt, dlon/dt) in degrees per second."""
+    u, v = wind(lat, lon, t_sec)
+    coslat = np.maximum(0.1, np.cos(np.deg2rad(lat)))
+    return v * DEG_PER_M_LAT, u * (DEG_PER_M_LAT / coslat)
+
+
+def simulate_particles(lat0, lon0, hours=6, dt_minutes=10, members=1, seed=None,
+                       wind=None, sigma_km=config.DIFFUSION_KM, integrator="rk2"):
+    """Advect and diffuse every source at once.
+
+    lat0/lon0 are (N,) source positions; each gets `members` ensemble particles.
+    wind is a (u, v) tuple in m/s or a callable wind(lat, lon, t_sec) -> (u, v) arrays,
+    defaulting to config.FALLBACK_WIND. Advection uses Heun's method ("rk2") or forward
+    Euler ("euler"). Noise comes from numpy.random.default_rng(seed), so a given seed
+    reproduces the same trajectories.
+    Returns (lat, lon, t_min) with lat/lon of shape (N, members, steps + 1).
+    """
+    if integrator not in ("rk2", "euler"):
+        raise ValueError(f"Unknown integrator: {integrator!r}")
+    rng = np.random.default_rng(seed)
     dt_sec = dt_minutes * 60
     steps = int(hours * 60 / dt_minutes)
+    if wind is None:
+        wind = config.FALLBACK_WIND
+    if not callable(wind):
+        wind = _constant_wind(*wind)
+
+    n = len(lat0)
+    lat = np.empty((n, members, steps + 1))
+    lon = np.empty((n, members, steps + 1))
+    lat[:, :, 0] = np.asarray(lat0, dtype=float)[:, None]
+    lon[:, :, 0] = np.asarray(lon0, dtype=float)[:, None]
+
+    # All diffusion draws up front: (2, N, members, steps) standard normals
+    sigma_deg = sigma_km * 0.009 * np.sqrt(dt_minutes / 60.0)
+    noise = rng.standard_normal((2, n, members, steps)) * sigma_deg
+
+    for s in range(1, steps + 1):
+        cur_lat, cur_lon = lat[:, :, s - 1], lon[:, :, s - 1]
+        t_sec = (s - 1) * dt_sec
+        k1_lat, k1_lon = _velocity_deg(wind, cur_lat, cur_lon, t_sec)
+        if integrator == "rk2":
+            # Heun: average the slope at the start and at the Euler-predicted end point
+            k2_lat, k2_lon = _velocity_deg(wind, cur_lat + k1_lat * dt_sec,
+                                           cur_lon + k1_lon * dt_sec, t_sec + dt_sec)
+            k1_lat, k1_lon = (k1_lat + k2_lat) / 2.0, (k1_lon + k2_lon) / 2.0
+        lat[:, :, s] = cur_lat + k1_lat * dt_sec + noise[0, :, :, s - 1]
+        lon[:, :, s] = cur_lon + k1_lon * dt_sec + noise[1, :, :, s - 1]
+
+    t_min = np.arange(steps + 1) * dt_minutes
+    return lat, lon, t_min
 
-    for _, r in df[df[config.ANOM_COL] == 1].iterrows():
-        lat, lon = r[config.LAT_COL], r[config.LON_COL]
-        traj = [{"lat": lat, "lon": lon, "t_min": 0}]
-        u, v = config.FALLBACK_WIND  # basic constant wind
-
-        for s in range(1, steps + 1):
-            lat, lon = step_latlon(lat, lon, u, v, dt_sec)
-            lat, lon = random_diffusion(lat, lon, dt_minutes / 60.0, config.DIFFUSION_KM)
-            traj.append({"lat": lat, "lon": lon, "t_min": s * dt_minutes})
-
-        out.append({
-            "id": f"plume_{int(r.name)}",
-            "signature": r.get("signature", "unknown"),
-            "path": traj
-        })
+
+def paths_to_json(ids, signatures, lat, lon, t_min):
+    """Serialize simulate_particles output into the plume path list used by the API."""
+    members = lat.shape[1]
+    t_list = t_min.tolist()
+    out = []
+    for i, (pid, sig) in enumerate(zip(ids, signatures)):
+        for k in range(members):
+            traj = [{"lat": a, "lon": b, "t_min": t}
+                    for a, b, t in zip(lat[i, k].tolist(), lon[i, k].tolist(), t_list)]
+            item = {"id": f"plume_{pid}" if members == 1 else f"plume_{pid}_m{k}",
+                    "signature": sig, "path": traj}
+            if members > 1:
+                item["member"] = k
+            out.append(item)
     return out
+
+
+def merra_wind(start, path=None):
+    """Wind callable from the MERRA-2 file for start's day (memory-mapped, cached per file).
+
+    Falls back to config.FALLBACK_WIND when the file or its wind variables are missing.
+    """
+    from backend.wind_field import WindField
+
+    path = path or config.MERRA_PATH_PATTERN.format(date=start)
+    try:
+        return WindField.cached(path).provider(start)
+    except (OSError, KeyError) as e:
+        if config.PRINT_LOGS:
+            print(f"⚠️ MERRA-2 winds unavailable ({e}); using FALLBACK_WIND")
+        return config.FALLBACK_WIND
+
+
+def plume_trajectories(df: pd.DataFrame, hours=6, dt_minutes=10, members=1, seed=None,
+                       wind=None, start=None) -> List[Dict]:
+    """Plume paths from every anomaly row.
+
+    Pass wind explicitly, or a start time (datetime) to advect with that day's MERRA-2 winds.
+    """
+    if wind is None and start is not None:
+        wind = merra_wind(start)
+    src = df[df[config.ANOM_COL] == 1]
+    lat, lon, t_min = simulate_particles(src[config.LAT_COL].to_numpy(), src[config.LON_COL].to_numpy(),
+                                         hours=hours, dt_minutes=dt_minutes, members=members,
+                                         seed=seed, wind=wind)
+    ids = [int(i) for i in src.index]
+    signatures = src["signature"].astype(str).tolist() if "signature" in src.columns \
+        else ["unknown"] * len(src)
+    return paths_to_json(ids, signatures, lat, lon, t_min)
@@ -4,11 +4,17 @@ Reads pollution data and creates heatmap overlays
 """
 
 import json
+import struct
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import LinearSegmentedColormap
 import pandas as pd
 
+import backend.config as config
+from backend.aqi import CATEGORIES, aqi_from_no2_column, category_counts
+from backend.aqi import colors as aqi_colors
+from backend.hotspots import extract_hotspots
+from backend.raster import colorize, rasterize, write_png, write_xyz_tiles
+
 def load_fused_data(filepath='fused_data.json'):
     """Load and parse the fused pollution dataset"""
     print(f"Loading data from {filepath}...")
@@ -30,212 +36,200 @@ def load_fused_data(filepath='fused_data.json'):
 
 def calculate_aqi_from_no2(no2_values):
     """
-    Convert NO2 concentration to AQI-like scale
-    NO2 is in molecules/cm² from satellite data
+    Convert NO2 columns to the EPA AQI
+    NO2 is in molecules/cm² from satellite data; it is turned into a surface
+    ppb proxy and looked up in the EPA 1-hour NO2 breakpoints (see aqi.py)
     """
-    # Scale NO2 to AQI range (simplified)
-    # Typical NO2 ranges: 1e14 to 1e16 molecules/cm²
-    aqi = np.clip(no2_values * 1e-14 * 50, 0, 500)
-    return aqi
+    return aqi_from_no2_column(no2_values)
 
 def get_aqi_color(aqi):
-    """Return RGB color based on AQI value"""
-    if aqi <= 50:
-        return (0, 228, 0)  # Green
-    elif aqi <= 100:
-        return (255, 255, 0)  # Yellow
-    elif aqi <= 150:
-        return (255, 126, 0)  # Orange
-    elif aqi <= 200:
-        return (255, 0, 0)  # Red
-    elif aqi <= 300:
-        return (143, 63, 151)  # Purple
-    else:
-        return (126, 0, 35)  # Maroon
+    """Return RGB color based on AQI value (use aqi.colors for arrays)"""
+    return tuple(int(c) for c in aqi_colors(aqi)[:3])
+
+BACKGROUND_RGBA = (10, 22, 40, 255)   # '#0a1628'
+ANOMALY_RGBA = (255, 0, 0, 255)
+
+
+def render_aqi_png(points, bbox, width, output_file, how='max'):
+    """
+    Rasterize AQI (mean or max per cell) over bbox, mark anomaly cells, write PNG
+    """
+    lat, lon = points['lat'].values, points['lon'].values
+    grid = rasterize(lat, lon, points['aqi'].values, bbox, width, how=how)
+    rgba = colorize(grid, background=BACKGROUND_RGBA)
+    if 'anomaly_flag' in points:
+        flagged = rasterize(lat, lon, points['anomaly_flag'].values, bbox, width, how='max')
+        rgba[flagged >= 1] = ANOMALY_RGBA
+    write_png(rgba, output_file)
+    return rgba
+
 
-def create_global_heatmap(df_valid, output_file='globe_pollution_heatmap.png'):
+def create_global_heatmap(df_valid, output_file='globe_pollution_heatmap.png',
+                          width=2048, how='max', tiles_dir=None):
     """
-    Create a global heatmap visualization of pollution data
+    Create a global heatmap raster of pollution data (one pixel per grid cell)
+    Optionally also writes XYZ web tiles under tiles_dir.
     """
     print("\nGenerating global heatmap...")
-    
+
     # Calculate AQI from NO2
     df_valid['aqi'] = calculate_aqi_from_no2(df_valid['NO2'])
-    
-    # Create figure
-    fig, ax = plt.subplots(figsize=(16, 8), facecolor='#0a1628')
-    ax.set_facecolor('#0a1628')
-    
-    # Create custom colormap (AQI colors)
-    colors = ['#00e400', '#ffff00', '#ff7e00', '#ff0000', '#8f3f97', '#7e0023']
-    n_bins = 6
-    cmap = LinearSegmentedColormap.from_list('aqi', colors, N=n_bins)
-    
-    # Plot as scatter with color based on AQI
-    scatter = ax.scatter(
-        df_valid['lon'], 
-        df_valid['lat'], 
-        c=df_valid['aqi'],
-        cmap=cmap,
-        s=1,
-        alpha=0.6,
-        vmin=0,
-        vmax=300
-    )
-    
-    # Highlight anomalies
-    anomalies = df_valid[df_valid['anomaly_flag'] == 1]
-    if len(anomalies) > 0:
-        ax.scatter(
-            anomalies['lon'],
-            anomalies['lat'],
-            c='red',
-            s=20,
-            marker='x',
-            alpha=0.8,
-            label=f'Anomalies ({len(anomalies)})'
-        )
-    
-    # Styling
-    ax.set_xlabel('Longitude', color='white', fontsize=12)
-    ax.set_ylabel('Latitude', color='white', fontsize=12)
-    ax.set_title('Global Pollution Heatmap (NO2 Concentrations)', 
-                 color='white', fontsize=16, pad=20)
-    ax.grid(True, alpha=0.2, color='white')
-    ax.tick_params(colors='white')
-    
-    # Colorbar
-    cbar = plt.colorbar(scatter, ax=ax, label='Air Quality Index (AQI)')
-    cbar.set_label('Air Quality Index (AQI)', color='white')
-    cbar.ax.yaxis.set_tick_params(color='white')
-    plt.setp(plt.getp(cbar.ax.axes, 'yticklabels'), color='white')
-    
-    if len(anomalies) > 0:
-        ax.legend(loc='upper right', facecolor='#1a2332', 
-                 edgecolor='white', labelcolor='white')
-    
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=150, facecolor='#0a1628', 
-                bbox_inches='tight')
-    print(f"Saved: {output_file}")
-    
-    return fig
 
-def create_regional_zoom(df_valid, center_lat, center_lon, 
-                        radius=10, output_file='regional_zoom.png'):
+    bbox = (df_valid['lon'].min(), df_valid['lat'].min(),
+            df_valid['lon'].max() + 1e-6, df_valid['lat'].max() + 1e-6)
+    rgba = render_aqi_png(df_valid, bbox, width, output_file, how=how)
+    print(f"Saved: {output_file} ({rgba.shape[1]}x{rgba.shape[0]})")
+
+    if tiles_dir is not None:
+        count = write_xyz_tiles(df_valid['lat'].values, df_valid['lon'].values,
+                                df_valid['aqi'].values, tiles_dir, how=how)
+        print(f"Saved: {count} XYZ tiles under {tiles_dir}")
+
+    return rgba
+
+def create_regional_zoom(df_valid, center_lat, center_lon,
+                        radius=10, output_file='regional_zoom.png', width=1024, how='max'):
     """
-    Create zoomed-in view of specific region
+    Create zoomed-in raster of specific region
     """
     print(f"\nGenerating regional zoom around ({center_lat}, {center_lon})...")
-    
+
     # Filter data within radius
     lat_min, lat_max = center_lat - radius, center_lat + radius
     lon_min, lon_max = center_lon - radius, center_lon + radius
-    
+
     regional = df_valid[
         (df_valid['lat'] >= lat_min) & (df_valid['lat'] <= lat_max) &
         (df_valid['lon'] >= lon_min) & (df_valid['lon'] <= lon_max)
-    ]
-    
+    ].copy()
+
     if len(regional) == 0:
         print(f"No data found in region ({lat_min}, {lon_min}) to ({lat_max}, {lon_max})")
         return None
-    
+
     print(f"Found {len(regional)} data points in region")
-    
+
     # Calculate AQI
     regional['aqi'] = calculate_aqi_from_no2(regional['NO2'])
-    
-    fig, ax = plt.subplots(figsize=(12, 10), facecolor='#0a1628')
-    ax.set_facecolor('#0a1628')
-    
-    # Plot pollution levels
-    colors = ['#00e400', '#ffff00', '#ff7e00', '#ff0000', '#8f3f97', '#7e0023']
-    cmap = LinearSegmentedColormap.from_list('aqi', colors, N=6)
-    
-    scatter = ax.scatter(
-        regional['lon'],
-        regional['lat'],
-        c=regional['aqi'],
-        cmap=cmap,
-        s=50,
-        alpha=0.7,
-        vmin=0,
-        vmax=300
-    )
-    
-    # Highlight anomalies
-    anomalies = regional[regional['anomaly_flag'] == 1]
-    if len(anomalies) > 0:
-        ax.scatter(
-            anomalies['lon'],
-            anomalies['lat'],
-            c='red',
-            s=200,
-            marker='*',
-            edgecolors='white',
-            linewidths=2,
-            alpha=0.9,
-            label=f'Anomalies ({len(anomalies)})',
-            zorder=10
-        )
-    
-    ax.set_xlabel('Longitude', color='white', fontsize=12)
-    ax.set_ylabel('Latitude', color='white', fontsize=12)
-    ax.set_title(f'Regional Detail: ({center_lat}°, {center_lon}°)', 
-                 color='white', fontsize=16, pad=20)
-    ax.grid(True, alpha=0.3, color='white')
-    ax.tick_params(colors='white')
-    
-    cbar = plt.colorbar(scatter, ax=ax, label='AQI')
-    cbar.set_label('Air Quality Index (AQI)', color='white')
-    cbar.ax.yaxis.set_tick_params(color='white')
-    plt.setp(plt.getp(cbar.ax.axes, 'yticklabels'), color='white')
-    
-    if len(anomalies) > 0:
-        ax.legend(loc='upper right', facecolor='#1a2332',
-                 edgecolor='white', labelcolor='white')
-    
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=150, facecolor='#0a1628',
-                bbox_inches='tight')
+
+    rgba = render_aqi_png(regional, (lon_min, lat_min, lon_max, lat_max), width, output_file, how=how)
     print(f"Saved: {output_file}")
-    
-    return fig
 
-def export_for_web_globe(df_valid, output_file='globe_data.json'):
+    return rgba
+
+def export_for_web_globe(df_valid, output_file='globe_data.json', max_points=50000):
     """
     Export processed data in format suitable for web globe
+    Columns are built as whole arrays; NaN temperatures become null.
     """
     print(f"\nExporting data for web visualization...")
     
-    # Calculate AQI
-    df_valid['aqi'] = calculate_aqi_from_no2(df_valid['NO2'])
-    
-    # Sample data if too large (>50k points)
-    if len(df_valid) > 50000:
-        print(f"Sampling {len(df_valid)} points to 50,000 for performance...")
-        df_export = df_valid.sample(n=50000, random_state=42)
-    else:
-        df_export = df_valid
-    
-    # Create export format
-    export_data = []
-    for _, row in df_export.iterrows():
-        export_data.append({
-            'lat': float(row['lat']),
-            'lon': float(row['lon']),
-            'aqi': float(row['aqi']),
-            'no2': float(row['NO2']),
-            'anomaly': int(row['anomaly_flag']),
-            'temp': float(row['T2M']) if 'T2M' in row else None,
-        })
-    
+    df_export = df_valid
+    if max_points is not None and len(df_valid) > max_points:
+        print(f"Sampling {len(df_valid)} points to {max_points:,} for performance...")
+        df_export = df_valid.sample(n=max_points, random_state=42)
+    
+    no2 = df_export['NO2'].to_numpy(dtype=np.float64)
+    temp = (df_export['T2M'].to_numpy(dtype=np.float64) if 'T2M' in df_export
+            else np.full(len(df_export), np.nan))
+    records = pd.DataFrame({
+        'lat': df_export['lat'].to_numpy(dtype=np.float64),
+        'lon': df_export['lon'].to_numpy(dtype=np.float64),
+        'aqi': calculate_aqi_from_no2(no2),
+        'no2': no2,
+        'anomaly': df_export['anomaly_flag'].fillna(0).to_numpy().astype(np.int64),
+        'temp': temp,
+    })
+    
+    # to_json writes NaN as null, matching the old per-row None
     with open(output_file, 'w') as f:
-        json.dump(export_data, f)
+        f.write(records.to_json(orient='records', double_precision=15))
     
-    print(f"Saved: {output_file} ({len(export_data)} points)")
-    return export_data
+    print(f"Saved: {output_file} ({len(records)} points)")
+    return records
+
+# Binary globe layout (little-endian), so the browser can wrap each block in a
+# typed array without parsing:
+#   header  32 bytes: magic "ADGB", uint16 version, uint16 flags, uint32 count,
+#           float32 lat_min, lon_min, lat_max, lon_max, uint32 reserved
+#   blocks  lat, lon (float32, or uint16 when FLAG_QUANTIZED), aqi, no2, temp
+#           (float32, NaN when missing), anomaly (uint8); each padded to 4 bytes
+GLOBE_MAGIC = b'ADGB'
+GLOBE_VERSION = 1
+GLOBE_HEADER = struct.Struct('<4sHHI4fI')
+FLAG_QUANTIZED = 1
+GLOBE_BLOCKS = ['lat', 'lon', 'aqi', 'no2', 'temp', 'anomaly']
+
+
+def _pad4(buf):
+    return buf + b'\0' * (-len(buf) % 4)
+
+
+def export_globe_binary(df_valid, output_file='globe_data.bin', max_points=None, quantize=False):
+    """
+    Export the web globe points as a compact binary file (see GLOBE_HEADER)
+    max_points samples down like export_for_web_globe; None keeps every point.
+    quantize stores lat/lon as uint16 steps across the data's bounding box.
+    """
+    print(f"\nExporting binary data for web visualization...")
+
+    df_export = df_valid
+    if max_points is not None and len(df_valid) > max_points:
+        print(f"Sampling {len(df_valid)} points to {max_points:,} for performance...")
+        df_export = df_valid.sample(n=max_points, random_state=42)
+
+    n = len(df_export)
+    lat = df_export['lat'].to_numpy(dtype=np.float64)
+    lon = df_export['lon'].to_numpy(dtype=np.float64)
+    no2 = df_export['NO2'].to_numpy(dtype=np.float64)
+    bounds = (lat.min(), lon.min(), lat.max(), lon.max()) if n else (0.0, 0.0, 0.0, 0.0)
+
+    columns = {
+        'aqi': calculate_aqi_from_no2(no2),
+        'no2': no2,
+        'temp': df_export['T2M'].to_numpy(dtype=np.float64) if 'T2M' in df_export else np.full(n, np.nan),
+    }
+    blocks = []
+    if quantize:
+        for values, lo, hi in ((lat, bounds[0], bounds[2]), (lon, bounds[1], bounds[3])):
+            span = (hi - lo) or 1.0
+            blocks.append(np.round((values - lo) / span * 65535).astype('<u2').tobytes())
+    else:
+        blocks += [lat.astype('<f4').tobytes(), lon.astype('<f4').tobytes()]
+    blocks += [columns[name].astype('<f4').tobytes() for name in ('aqi', 'no2', 'temp')]
+    blocks.append(df_export['anomaly_flag'].fillna(0).to_numpy().astype(np.uint8).tobytes())
+
+    header = GLOBE_HEADER.pack(GLOBE_MAGIC, GLOBE_VERSION, FLAG_QUANTIZED if quantize else 0, n, *bounds, 0)
+    payload = header + b''.join(_pad4(b) for b in blocks)
+    with open(output_file, 'wb') as f:
+        f.write(payload)
+
+    print(f"Saved: {output_file} ({n:,} points, {len(payload)/1e6:.2f} MB)")
+    return payload
+
+
+def read_globe_binary(payload):
+    """
+    Decode export_globe_binary bytes back into a dict of numpy arrays
+    """
+    magic, version, flags, n, lat_min, lon_min, lat_max, lon_max, _ = GLOBE_HEADER.unpack_from(payload)
+    if magic != GLOBE_MAGIC or version != GLOBE_VERSION:
+        raise ValueError("Not an ADIS globe binary (or unsupported version)")
+    out, offset = {}, GLOBE_HEADER.size
+    for name in GLOBE_BLOCKS:
+        if name == 'anomaly':
+            dtype = np.uint8
+        elif name in ('lat', 'lon') and flags & FLAG_QUANTIZED:
+            dtype = np.dtype('<u2')
+        else:
+            dtype = np.dtype('<f4')
+        out[name] = np.frombuffer(payload, dtype=dtype, count=n, offset=offset)
+        offset += n * np.dtype(dtype).itemsize
+        offset += -offset % 4
+    if flags & FLAG_QUANTIZED:
+        out['lat'] = lat_min + out['lat'] / 65535.0 * ((lat_max - lat_min) or 1.0)
+        out['lon'] = lon_min + out['lon'] / 65535.0 * ((lon_max - lon_min) or 1.0)
+    return out
 
 def generate_statistics_report(df, df_valid):
     """
@@ -264,10 +258,9 @@ def generate_statistics_report(df, df_valid):
     aqi_values = calculate_aqi_from_no2(df_valid['NO2'])
     print(f"\nAir Quality Index (Estimated):")
     print(f"  Mean AQI: {aqi_values.mean():.1f}")
-    print(f"  Good (0-50): {(aqi_values <= 50).sum():,} points ({(aqi_values <= 50).sum()/len(aqi_values)*100:.1f}%)")
-    print(f"  Moderate (51-100): {((aqi_values > 50) & (aqi_values <= 100)).sum():,} points")
-    print(f"  Unhealthy (101-200): {((aqi_values > 100) & (aqi_values <= 200)).sum():,} points")
-    print(f"  Very Unhealthy (201+): {(aqi_values > 200).sum():,} points")
+    counts = category_counts(aqi_values)
+    for name, count in zip(CATEGORIES, counts):
+        print(f"  {name}: {count:,} points ({count/len(aqi_values)*100:.1f}%)")
     
     print(f"\nAnomaly Detection:")
     print(f"  Total anomalies: {df['anomaly_flag'].sum():,}")
@@ -292,23 +285,25 @@ if __name__ == "__main__":
     generate_statistics_report(df_all, df_valid)
     
     # Create visualizations
-    create_global_heatmap(df_valid, 'globe_pollution_heatmap.png')
+    create_global_heatmap(df_valid, 'globe_pollution_heatmap.png', tiles_dir=config.HEATMAP_TILE_DIR)
     
     # Export for web globe
     export_for_web_globe(df_valid, 'globe_data.json')
+    export_globe_binary(df_valid, 'globe_data.bin', quantize=True)
     
     # Optional: Create regional zooms for hotspots
-    # Find regions with highest pollution
-    df_valid['aqi'] = calculate_aqi_from_no2(df_valid['NO2'])
-    hotspots = df_valid.nlargest(5, 'aqi')
+    # Cluster anomaly pixels so one plume counts as one hotspot
+    hotspots = extract_hotspots(df_valid)[:5]
     
     print("\nTop 5 Pollution Hotspots:")
-    for i, row in hotspots.iterrows():
-        print(f"  {i+1}. Lat: {row['lat']:.2f}, Lon: {row['lon']:.2f}, AQI: {row['aqi']:.1f}")
+    for i, spot in enumerate(hotspots):
+        peak_aqi = calculate_aqi_from_no2([spot['peak']['no2']])[0]
+        print(f"  {i+1}. Lat: {spot['lat']:.2f}, Lon: {spot['lon']:.2f}, Peak AQI: {peak_aqi:.0f}, "
+              f"Area: {spot['area_km2']:.0f} km², {spot['signature']}")
     
     # Create zoom for highest pollution area
     if len(hotspots) > 0:
-        top_spot = hotspots.iloc[0]
+        top_spot = hotspots[0]['peak']
         create_regional_zoom(df_valid, top_spot['lat'], top_spot['lon'],
                            radius=5, output_file='hotspot_zoom.png')
     
@@ -317,8 +312,10 @@ if __name__ == "__main__":
     print("="*70)
     print("\nGenerated files:")
     print("  📊 globe_pollution_heatmap.png - Global heatmap visualization")
+    print(f"  🗺️  {config.HEATMAP_TILE_DIR}/{{z}}/{{x}}/{{y}}.png - AQI heatmap web tiles")
     print("  📍 hotspot_zoom.png - Zoomed view of highest pollution area")
     print("  📦 globe_data.json - Processed data for web globe (50k points)")
+    print("  📦 globe_data.bin - Every point as typed-array blocks (see GLOBE_HEADER)")
     print("\nTo use in your React app:")
     print("  1. Copy globe_data.json to your React app's public/ directory")
     print("  2. Fetch it in your app with: fetch('/globe_data.json')")
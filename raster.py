@@ -0,0 +1,145 @@
+# raster.py
+# --------------------------------------------
+# Raster heatmap renderer for ADIS
+# Points are binned straight into an image grid (mean or max per cell)
+# with bincount / reduceat, coloured by AQI category (aqi.COLORS) and
+# written as PNG with zlib (no plotting library).
+# The same binning on the Web Mercator pixel grid emits XYZ tiles.
+# --------------------------------------------
+
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import backend.config as config
+from backend.aqi import colors as aqi_colors
+from backend.tile_pyramid import encode_keys, lonlat_to_global
+
+TILE_BITS = 8   # 256 x 256 pixel tiles
+TRANSPARENT = (0, 0, 0, 0)
+
+
+# === Binning ===
+
+def reduce_sorted(values, starts, how="mean"):
+    """Mean or max of each run of values[starts[i]:starts[i+1]] (values already grouped)."""
+    if how == "mean":
+        counts = np.diff(np.r_[starts, len(values)])
+        return np.add.reduceat(values, starts) / counts
+    if how == "max":
+        return np.maximum.reduceat(values, starts)
+    raise ValueError(f"Unknown reduction: {how!r}")
+
+
+def reduce_cells(ids, values, size, how="mean"):
+    """Per-cell mean or max of values over flat cell ids; NaN where a cell is empty."""
+    ids = np.asarray(ids, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    ok = np.isfinite(values)
+    ids, values = ids[ok], values[ok]
+    out = np.full(size, np.nan)
+    if not len(ids):
+        return out
+    if how == "mean":
+        count = np.bincount(ids, minlength=size)
+        total = np.bincount(ids, weights=values, minlength=size)
+        np.divide(total, count, out=out, where=count > 0)
+    else:
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        out[ids[starts]] = reduce_sorted(values[order], starts, how)
+    return out
+
+
+def rasterize(lat, lon, values, bbox, width, height=None, how="mean"):
+    """Bin points into a (height, width) equirectangular grid over (west, south, east, north).
+
+    Row 0 is the northern edge. height defaults to keep cells square in degrees.
+    The bbox is closed: points on the south / east edge land in the last row / column.
+    """
+    west, south, east, north = bbox
+    if height is None:
+        height = max(1, int(round(width * (north - south) / (east - west))))
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    inside = (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+    lat, lon = lat[inside], lon[inside]
+    col = np.minimum(np.floor((lon - west) / (east - west) * width).astype(np.int64), width - 1)
+    row = np.minimum(np.floor((north - lat) / (north - south) * height).astype(np.int64), height - 1)
+    grid = reduce_cells(row * width + col, np.asarray(values)[inside], width * height, how)
+    return grid.reshape(height, width)
+
+
+# === Colour + PNG ===
+
+def colorize(aqi, background=TRANSPARENT):
+    """RGBA image from an AQI grid (category colour lookup), background where NaN."""
+    return aqi_colors(aqi, missing=background)
+
+
+def encode_png(rgba, level=6):
+    """Encode an (H, W, 4) uint8 array as PNG bytes."""
+    rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)   # filter byte 0 per scanline
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+            + chunk(b"IEND", b""))
+
+
+def write_png(rgba, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(encode_png(rgba))
+
+
+# === XYZ tiles ===
+
+def write_xyz_tiles(lat, lon, aqi, out_dir=None, zooms=None, how="mean", level=1):
+    """Render {out_dir}/{z}/{x}/{y}.png for every tile that has data. Returns the tile count.
+
+    Each zoom sorts all points once by tile-major pixel key, so every output pixel is
+    one run and every tile one contiguous slice of already coloured pixels; tiles
+    are then encoded one by one (zlib level 1 by default: render time over size).
+    """
+    out_dir = out_dir or config.HEATMAP_TILE_DIR
+    zooms = range(config.HEATMAP_MAX_ZOOM + 1) if zooms is None else zooms
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    aqi = np.asarray(aqi, dtype=float)
+    ok = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(aqi)
+    lat, lon, aqi = lat[ok], lon[ok], aqi[ok]
+    if not len(aqi):
+        return 0
+    side = 1 << TILE_BITS
+    written = 0
+    for z in zooms:
+        gx, gy = lonlat_to_global(lat, lon, z + TILE_BITS)
+        keys = encode_keys(gx, gy, z, TILE_BITS)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        colors = colorize(reduce_sorted(aqi[order], starts, how))
+        keys = keys[starts]
+        tiles = keys >> (2 * TILE_BITS)
+        bounds = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1], True])
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            tile = int(tiles[a])
+            tx, ty = tile & ((1 << z) - 1), tile >> z
+            rgba = np.zeros((side * side, 4), dtype=np.uint8)
+            rgba[keys[a:b] & (side * side - 1)] = colors[a:b]
+            path = os.path.join(out_dir, str(z), str(tx), f"{ty}.png")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(encode_png(rgba.reshape(side, side, 4), level=level))
+            written += 1
+    return written
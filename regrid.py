@@ -0,0 +1,105 @@
+# regrid.py
+# --------------------------------------------
+# Regular lat/lon grid sampling for ADIS
+# MERRA-2 fields sit on a fixed 0.5° x 0.625° grid, so the cell holding any
+# point is found by index arithmetic instead of a tree search. Values are
+# read straight from the 2D arrays (no DataFrame flattening).
+# --------------------------------------------
+
+import numpy as np
+
+
+def grid_axes(ds, lat_name="lat", lon_name="lon"):
+    """Return (lat0, dlat, nlat, lon0, dlon, nlon) for a regular grid dataset."""
+    lat = np.asarray(ds[lat_name].values, dtype=float)
+    lon = np.asarray(ds[lon_name].values, dtype=float)
+    dlat, dlon = np.diff(lat), np.diff(lon)
+    if not (np.allclose(dlat, dlat[0]) and np.allclose(dlon, dlon[0])):
+        raise ValueError("Dataset is not on a regular lat/lon grid")
+    return lat[0], dlat[0], len(lat), lon[0], dlon[0], len(lon)
+
+
+def _is_global_lon(lon0, dlon, nlon):
+    return np.isclose(abs(dlon) * nlon, 360.0)
+
+
+def grid_positions(lat, lon, axes):
+    """Fractional (row, col) grid coordinates of each point."""
+    lat0, dlat, nlat, lon0, dlon, nlon = axes
+    fi = (np.asarray(lat, dtype=float) - lat0) / dlat
+    if _is_global_lon(lon0, dlon, nlon):
+        fj = ((np.asarray(lon, dtype=float) - lon0) % 360.0) / dlon
+    else:
+        fj = (np.asarray(lon, dtype=float) - lon0) / dlon
+    return fi, fj
+
+
+def sample_grid(field, lat, lon, axes, method="bilinear"):
+    """Sample a 2D (lat, lon) array at arbitrary points; out-of-grid points get NaN."""
+    field = np.asarray(field)
+    lat0, dlat, nlat, lon0, dlon, nlon = axes
+    periodic = _is_global_lon(lon0, dlon, nlon)
+    fi, fj = grid_positions(lat, lon, axes)
+    out = np.full(fi.shape, np.nan)
+
+    if method == "nearest":
+        i = np.rint(fi).astype(np.int64)
+        j = np.rint(fj).astype(np.int64)
+        if periodic:
+            j %= nlon
+        ok = (i >= 0) & (i < nlat) & (j >= 0) & (j < nlon)
+        out[ok] = field[i[ok], j[ok]]
+        return out
+
+    if method != "bilinear":
+        raise ValueError(f"Unknown interpolation method: {method!r}")
+
+    # Clamp the top row / last column so points on the edge still interpolate
+    i0 = np.clip(np.floor(fi), 0, nlat - 2).astype(np.int64)
+    j0 = np.floor(fj).astype(np.int64)
+    if not periodic:
+        j0 = np.clip(j0, 0, nlon - 2)
+    ok = (fi >= 0) & (fi <= nlat - 1)
+    if not periodic:
+        ok &= (fj >= 0) & (fj <= nlon - 1)
+    j0 %= nlon
+    j1 = (j0 + 1) % nlon if periodic else j0 + 1
+
+    wi = (fi - i0)[ok]
+    wj = (fj - np.floor(fj) if periodic else fj - j0)[ok]
+    i0, j0, j1 = i0[ok], j0[ok], j1[ok]
+    out[ok] = ((1 - wi) * (1 - wj) * field[i0, j0] + (1 - wi) * wj * field[i0, j1]
+               + wi * (1 - wj) * field[i0 + 1, j0] + wi * wj * field[i0 + 1, j1])
+    return out
+
+
+class GridFields:
+    """Named 2D (lat, lon) arrays sharing one regular grid: all grid sampling needs.
+
+    Lets fusion run on plain (e.g. shared-memory) arrays instead of an xarray Dataset.
+    """
+
+    def __init__(self, fields, axes):
+        self.fields = fields
+        self.axes = tuple(axes)
+
+    @classmethod
+    def from_dataset(cls, ds, variables, lat_name="lat", lon_name="lon", dtype=np.float32):
+        fields = {var: np.ascontiguousarray(ds[var].transpose(lat_name, lon_name).values, dtype=dtype)
+                  for var in variables}
+        return cls(fields, grid_axes(ds, lat_name, lon_name))
+
+    def sample(self, variables, lat, lon, method="bilinear"):
+        return {var: sample_grid(self.fields[var], lat, lon, self.axes, method) for var in variables}
+
+
+def interp_to_points(ds, variables, lat, lon, method="bilinear", lat_name="lat", lon_name="lon"):
+    """Interpolate each 2D (lat, lon) variable of ds (Dataset or GridFields) onto the given points."""
+    if isinstance(ds, GridFields):
+        return ds.sample(variables, lat, lon, method)
+    axes = grid_axes(ds, lat_name, lon_name)
+    out = {}
+    for var in variables:
+        field = ds[var].transpose(lat_name, lon_name).values
+        out[var] = sample_grid(field, lat, lon, axes, method)
+    return out
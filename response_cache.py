@@ -0,0 +1,108 @@
+# response_cache.py
+# --------------------------------------------
+# Pre-serialized, precompressed API payloads for ADIS
+# Each entry holds the response body once as bytes plus its gzip (and
+# brotli, if installed) encodings and a content ETag. Entries are keyed by
+# name and rebuilt only when their version (file mtime/size, store
+# fingerprint, ...) changes, so a cache hit is a memory copy.
+# --------------------------------------------
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+@dataclass
+class CachedPayload:
+    version: object
+    body: bytes
+    etag: str
+    mimetype: str = "application/json"
+    encoded: dict = field(default_factory=dict)   # {"gzip": bytes, "br": bytes}
+
+    @classmethod
+    def build(cls, version, body, mimetype="application/json", compress_min=1024):
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        encoded = {}
+        if len(body) >= compress_min:
+            encoded["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                encoded["br"] = brotli.compress(body, quality=5)
+        return cls(version, body, etag, mimetype, encoded)
+
+    def negotiate(self, accept_encoding):
+        """Best (encoding, body) for an Accept-Encoding header; encoding None = identity."""
+        accepted = {token.split(";")[0].strip().lower() for token in (accept_encoding or "").split(",")}
+        for name in ("br", "gzip"):
+            if name in accepted and name in self.encoded:
+                return name, self.encoded[name]
+        return None, self.body
+
+
+class ResponseCache:
+    """Thread-safe name -> CachedPayload map, rebuilt when an entry's version changes.
+
+    With max_entries set, the least recently used entries are evicted beyond that size.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def get(self, name, version, build, mimetype="application/json"):
+        """Return the payload for name at version, calling build() -> bytes on a miss."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(name)
+                return entry
+            # One builder per name; concurrent requests wait for it instead of rebuilding
+            lock = self._building.setdefault(name, threading.Lock())
+        with lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.version != version:
+                entry = CachedPayload.build(version, build(), mimetype)
+                with self._lock:
+                    self._entries[name] = entry
+                    self._entries.move_to_end(name)
+                    while self.max_entries and len(self._entries) > self.max_entries:
+                        evicted, _ = self._entries.popitem(last=False)
+                        self._building.pop(evicted, None)
+        return entry
+
+    def peek(self, name, version):
+        """The cached payload for name at version, or None (never builds)."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(name)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def file_version(path):
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
@@ -1,25 +1,53 @@
 # signature.py
+import numpy as np
 import pandas as pd
 import backend.config as config
 
+_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+}
+
+
+def rule_masks(df: pd.DataFrame, rules) -> list:
+    """One boolean mask per (label, conditions) rule.
+
+    A condition is (column, op, threshold). Missing columns and NaN values never match,
+    like the old per-row row.get(...) checks.
+    """
+    columns = {}
+    masks = []
+    for _, conditions in rules:
+        mask = np.ones(len(df), dtype=bool)
+        for col, op, threshold in conditions:
+            if col not in df.columns:
+                mask[:] = False
+                break
+            if col not in columns:
+                columns[col] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+            with np.errstate(invalid="ignore"):
+                mask &= _OPS[op](columns[col], threshold)
+        masks.append(mask)
+    return masks
+
+
+def classify_signatures(df: pd.DataFrame, rules=None, default=None) -> pd.Categorical:
+    """Label every row with the first matching rule (config.SIGNATURE_RULES order)."""
+    rules = config.SIGNATURE_RULES if rules is None else rules
+    default = config.SIGNATURE_DEFAULT if default is None else default
+    categories = list(dict.fromkeys([label for label, _ in rules] + [default]))
+    codes = [categories.index(label) for label, _ in rules]
+    picked = np.select(rule_masks(df, rules), codes, default=categories.index(default))
+    return pd.Categorical.from_codes(picked.astype(np.int16), categories=categories)
+
 
 def classify_signature(row: pd.Series) -> str:
-    no2 = row.get(config.NO2_COL, 0)
-    t2m = row.get(config.T2M_COL, None)
-    qv  = row.get(config.QV2M_COL, None)
-    ps  = row.get(config.PS_COL, None)
-
-    if no2 >= 2e16 and t2m and t2m > 300:
-        return "wildfire/biomass (hot & high NO₂)"
-    if no2 >= 2e16 and ps and ps > 101500:
-        return "industrial/urban plume"
-    if no2 >= 1e16 and qv and qv > 0.012:
-        return "stagnant/humid accumulation"
-    if no2 >= 1e16:
-        return "traffic/urban"
-    return "background"
-
-def attach_signatures(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out["signature"] = df.apply(classify_signature, axis=1)
+    return str(classify_signatures(row.to_frame().T)[0])
+
+def attach_signatures(df: pd.DataFrame, rules=None) -> pd.DataFrame:
+    out = df.copy(deep=False)
+    out["signature"] = classify_signatures(df, rules)
     return out
@@ -0,0 +1,116 @@
+# spatial_index.py
+# --------------------------------------------
+# Great-circle spatial index for ADIS
+# Points live on the unit sphere as 3D (x, y, z) vectors, so KD-tree
+# Euclidean distances are chord lengths: correct at every latitude and
+# across the antimeridian. Trees over fixed grids (MERRA-2) are cached
+# on disk, keyed by a hash of the grid coordinates.
+# --------------------------------------------
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import backend.config as config
+
+
+def latlon_to_xyz(lat, lon):
+    """Convert lat/lon in degrees to (N, 3) unit-sphere vectors."""
+    lat = np.deg2rad(np.asarray(lat, dtype=float))
+    lon = np.deg2rad(np.asarray(lon, dtype=float))
+    coslat = np.cos(lat)
+    return np.column_stack([
+        (coslat * np.cos(lon)).ravel(),
+        (coslat * np.sin(lon)).ravel(),
+        np.sin(lat).ravel(),
+    ])
+
+
+def km_to_chord(distance_km):
+    """Great-circle distance (km) -> straight-line chord on the unit sphere."""
+    angle = np.asarray(distance_km, dtype=float) / config.EARTH_RADIUS_KM
+    return 2.0 * np.sin(np.minimum(angle, np.pi) / 2.0)
+
+
+def chord_to_km(chord):
+    """Unit-sphere chord length -> great-circle distance (km)."""
+    half = np.clip(np.asarray(chord, dtype=float) / 2.0, 0.0, 1.0)
+    return 2.0 * config.EARTH_RADIUS_KM * np.arcsin(half)
+
+
+def grid_hash(lat, lon):
+    """Stable hash of a coordinate set, used as the on-disk cache key."""
+    h = hashlib.sha1()
+    for arr in (lat, lon):
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+class SphericalIndex:
+    """KD-tree over unit-sphere coordinates with km-based queries."""
+
+    def __init__(self, lat, lon, tree=None, key=None):
+        self.lat = np.asarray(lat, dtype=float).ravel()
+        self.lon = np.asarray(lon, dtype=float).ravel()
+        self.xyz = latlon_to_xyz(self.lat, self.lon)
+        self.tree = tree if tree is not None else cKDTree(self.xyz)
+        self.key = key or grid_hash(self.lat, self.lon)
+
+    def __len__(self):
+        return len(self.lat)
+
+    # === Persistence ===
+
+    @classmethod
+    def cached(cls, lat, lon, cache_dir=None):
+        """Load the index for these coordinates from disk, building it on a miss."""
+        cache_dir = cache_dir or config.INDEX_CACHE_DIR
+        key = grid_hash(lat, lon)
+        path = os.path.join(cache_dir, f"{key}.pkl")
+        if os.path.exists(path):
+            try:
+                return cls.load(path, lat, lon)
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                pass  # corrupt or stale entry: rebuild below
+        index = cls(lat, lon, key=key)
+        index.save(path)
+        return index
+
+    def save(self, path):
+        """Write the tree atomically (temp file + rename)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump({"key": self.key, "tree": self.tree}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, lat, lon):
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+        if payload["tree"].n != np.size(lat):
+            raise ValueError("Cached index does not match grid size")
+        return cls(lat, lon, tree=payload["tree"], key=payload["key"])
+
+    # === Queries ===
+
+    def query(self, lat, lon, k=1, max_km=np.inf):
+        """k-nearest neighbors. Returns (distance_km, index); misses get inf / len(self)."""
+        chord_max = km_to_chord(max_km) if np.isfinite(max_km) else np.inf
+        chord, idx = self.tree.query(latlon_to_xyz(lat, lon), k=k, distance_upper_bound=chord_max)
+        dist = np.where(np.isfinite(chord), chord_to_km(np.where(np.isfinite(chord), chord, 0)), np.inf)
+        return dist, idx
+
+    def query_ball(self, lat, lon, radius_km):
+        """All indexed points within radius_km of each query point (list of lists)."""
+        return self.tree.query_ball_point(latlon_to_xyz(lat, lon), r=float(km_to_chord(radius_km)))
+
+    def distance_km(self, lat, lon, idx):
+        """Great-circle distance between query points and indexed points idx (paired)."""
+        chord = np.linalg.norm(latlon_to_xyz(lat, lon) - self.xyz[idx], axis=1)
+        return chord_to_km(chord)
@@ -0,0 +1,150 @@
+# stats.py
+# --------------------------------------------
+# Streaming dataset statistics for ADIS
+# One pass over fused chunks keeps, per column, count / mean / M2
+# (Welford, merged chunk-wise with Chan's update), min / max and a
+# fixed-bin histogram, plus anomaly, signature and AQI category counts.
+# Accumulators merge exactly, so partitions or workers can be summarized
+# separately and combined afterwards.
+# --------------------------------------------
+
+import numpy as np
+
+import backend.config as config
+from backend.aqi import CATEGORIES, aqi_from_no2_column, category_counts
+from backend.signature import classify_signatures
+
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+class StatsAccumulator:
+    """Mergeable summary of fused rows; update() per chunk, merge() across partitions."""
+
+    def __init__(self, columns=None, histograms=None):
+        self.columns = list(config.STATS_COLUMNS if columns is None else columns)
+        self.histograms = dict(config.STATS_HISTOGRAMS if histograms is None else histograms)
+        self.rows = 0
+        self.n = {c: 0 for c in self.columns}
+        self.mean = {c: 0.0 for c in self.columns}
+        self.m2 = {c: 0.0 for c in self.columns}
+        self.min = {c: np.inf for c in self.columns}
+        self.max = {c: -np.inf for c in self.columns}
+        # bins + underflow (first) + overflow (last)
+        self.hist = {c: np.zeros(spec[2] + 2, dtype=np.int64) for c, spec in self.histograms.items()}
+        self.anomalies = 0
+        self.signatures = {}
+        self.aqi = np.zeros(len(CATEGORIES), dtype=np.int64)
+
+    @classmethod
+    def from_store(cls, store, bbox=None, start=None, end=None, **kwargs):
+        acc = cls(**kwargs)
+        for chunk in store.iter_parts(acc.needed_columns(), bbox=bbox, start=start, end=end):
+            acc.update(chunk)
+        return acc
+
+    def needed_columns(self):
+        rule_cols = [col for _, conditions in config.SIGNATURE_RULES for col, _, _ in conditions]
+        return list(dict.fromkeys(self.columns + list(self.histograms) + [config.NO2_COL, config.ANOM_COL] + rule_cols))
+
+    # === Accumulation ===
+
+    def _combine(self, col, n_b, mean_b, m2_b):
+        n_a = self.n[col]
+        tot = n_a + n_b
+        delta = mean_b - self.mean[col]
+        self.mean[col] += delta * n_b / tot
+        self.m2[col] += m2_b + delta * delta * n_a * n_b / tot
+        self.n[col] = tot
+
+    def update(self, df):
+        self.rows += len(df)
+        for col in self.columns:
+            if col not in df.columns:
+                continue
+            x = df[col].to_numpy(dtype=np.float64)
+            x = x[np.isfinite(x)]
+            if not len(x):
+                continue
+            mean = x.mean()
+            self._combine(col, len(x), mean, float(((x - mean) ** 2).sum()))
+            self.min[col] = min(self.min[col], float(x.min()))
+            self.max[col] = max(self.max[col], float(x.max()))
+
+        for col, (lo, hi, bins, scale) in self.histograms.items():
+            if col not in df.columns:
+                continue
+            x = df[col].to_numpy(dtype=np.float64)
+            if scale == "log10":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    x = np.log10(x)
+            x = x[np.isfinite(x)]
+            idx = np.clip(np.floor((x - lo) / (hi - lo) * bins).astype(np.int64) + 1, 0, bins + 1)
+            self.hist[col] += np.bincount(idx, minlength=bins + 2)
+
+        if config.NO2_COL in df.columns:
+            self.aqi += category_counts(aqi_from_no2_column(df[config.NO2_COL].to_numpy(dtype=np.float64)))
+        if config.ANOM_COL in df.columns:
+            flagged = df[df[config.ANOM_COL].to_numpy() == 1]
+            self.anomalies += len(flagged)
+            if len(flagged):
+                counts = classify_signatures(flagged).value_counts()
+                for label, count in counts.items():
+                    if count:
+                        self.signatures[label] = self.signatures.get(label, 0) + int(count)
+        return self
+
+    def merge(self, other):
+        """Fold another accumulator (same columns / histogram specs) into this one."""
+        self.rows += other.rows
+        for col in self.columns:
+            if other.n.get(col):
+                if self.n[col]:
+                    self._combine(col, other.n[col], other.mean[col], other.m2[col])
+                else:
+                    self.n[col], self.mean[col], self.m2[col] = other.n[col], other.mean[col], other.m2[col]
+                self.min[col] = min(self.min[col], other.min[col])
+                self.max[col] = max(self.max[col], other.max[col])
+        for col in self.hist:
+            self.hist[col] += other.hist[col]
+        self.anomalies += other.anomalies
+        for label, count in other.signatures.items():
+            self.signatures[label] = self.signatures.get(label, 0) + count
+        self.aqi += other.aqi
+        return self
+
+    # === Output ===
+
+    def result(self):
+        """JSON-ready summary (None where a column had no finite values)."""
+        columns = {}
+        for col in self.columns:
+            n = self.n[col]
+            columns[col] = {
+                "count": n,
+                "mean": _finite(self.mean[col]) if n else None,
+                "std": _finite(np.sqrt(self.m2[col] / (n - 1))) if n > 1 else None,
+                "min": _finite(self.min[col]),
+                "max": _finite(self.max[col]),
+            }
+        histograms = {}
+        for col, (lo, hi, bins, scale) in self.histograms.items():
+            counts = self.hist[col]
+            histograms[col] = {
+                "scale": scale,
+                "edges": np.linspace(lo, hi, bins + 1).tolist(),
+                "counts": counts[1:-1].tolist(),
+                "underflow": int(counts[0]),
+                "overflow": int(counts[-1]),
+            }
+        return {
+            "rows": self.rows,
+            "columns": columns,
+            "histograms": histograms,
+            "anomalies": self.anomalies,
+            "anomaly_rate": self.anomalies / self.rows if self.rows else None,
+            "signatures": self.signatures,
+            "aqi_categories": dict(zip(CATEGORIES, self.aqi.tolist())),
+        }
@@ -0,0 +1,90 @@
+# tempo_reader.py
+# --------------------------------------------
+# Streaming TEMPO L2 reader for ADIS
+# Walks the granule in mirror-step (scanline) blocks straight from the
+# h5py datasets, applies quality-flag / fill-value / MIN_NO2 masks while
+# reading, and yields compact float32 column chunks. Peak memory is one
+# block, whatever the granule size.
+# --------------------------------------------
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import backend.config as config
+
+NO2_VAR = "product/vertical_column_troposphere"
+QUALITY_VAR = "product/main_data_quality_flag"
+LAT_VAR = "geolocation/latitude"
+LON_VAR = "geolocation/longitude"
+
+TARGET_CHUNK_PIXELS = 1 << 20   # ~1M pixels (~12 MB of float32 columns) per block
+
+
+def _fill_value(dataset):
+    fill = dataset.attrs.get("_FillValue")
+    if fill is None:
+        return None
+    return np.asarray(fill).ravel()[0]
+
+
+def _valid(values, fill):
+    ok = np.isfinite(values)
+    if fill is not None:
+        ok &= values != fill
+    return ok
+
+
+def default_chunk_rows(dataset):
+    """Scanlines per block: the HDF5 chunk height if chunked, else ~TARGET_CHUNK_PIXELS."""
+    pixels_per_row = int(np.prod(dataset.shape[1:])) or 1
+    rows = max(1, TARGET_CHUNK_PIXELS // pixels_per_row)
+    if dataset.chunks:
+        # Read whole HDF5 chunks so no chunk is decompressed twice
+        rows = max(dataset.chunks[0], rows // dataset.chunks[0] * dataset.chunks[0])
+    return rows
+
+
+def iter_tempo_chunks(path, chunk_rows=None, max_quality_flag=0, min_no2=config.MIN_NO2):
+    """Yield {"lat", "lon", "NO2"} float32 arrays of valid pixels, one scanline block at a time.
+
+    Pixels are dropped when the quality flag exceeds max_quality_flag (None disables the
+    check), when any field is non-finite or equals its _FillValue, or when NO2 < min_no2.
+    """
+    with h5py.File(path, "r") as f:
+        no2_ds, lat_ds, lon_ds = f[NO2_VAR], f[LAT_VAR], f[LON_VAR]
+        qf_ds = f[QUALITY_VAR] if (max_quality_flag is not None and QUALITY_VAR in f) else None
+        fills = [_fill_value(d) for d in (no2_ds, lat_ds, lon_ds)]
+        step = chunk_rows or default_chunk_rows(no2_ds)
+
+        for start in range(0, no2_ds.shape[0], step):
+            block = slice(start, min(start + step, no2_ds.shape[0]))
+            no2 = no2_ds[block]
+            ok = _valid(no2, fills[0])
+            if min_no2 is not None:
+                ok &= no2 >= min_no2
+            if qf_ds is not None:
+                ok &= qf_ds[block] <= max_quality_flag
+            if not ok.any():
+                continue
+
+            lat, lon = lat_ds[block], lon_ds[block]
+            ok &= _valid(lat, fills[1]) & _valid(lon, fills[2])
+            yield {
+                "lat": lat[ok].astype(np.float32),
+                "lon": lon[ok].astype(np.float32),
+                "NO2": no2[ok].astype(np.float32),
+            }
+
+
+def chunk_to_frame(chunk):
+    """Wrap one reader chunk as a DataFrame (zero-copy for the column arrays)."""
+    return pd.DataFrame(chunk, copy=False)
+
+
+def read_tempo(path, **kwargs):
+    """Read a whole granule through the streaming reader into one DataFrame."""
+    frames = [chunk_to_frame(c) for c in iter_tempo_chunks(path, **kwargs)]
+    if not frames:
+        return pd.DataFrame({c: np.array([], dtype=np.float32) for c in ("lat", "lon", "NO2")})
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,273 @@
+# tile_pyramid.py
+# --------------------------------------------
+# Level-of-detail tile pyramid for the ADIS globe
+# Fused pixels are binned on the XYZ (Web Mercator) tile grid: every tile
+# is split into 2**BIN_BITS x 2**BIN_BITS bins holding count, NO2 sum/max
+# and anomaly count. Fusion keeps the finest level's bins per store date
+# (one file per day, so a run re-reads only the days it wrote) and merges
+# them into pyramid.npz once per run; coarser levels come from merging
+# 2x2 bins. Bin keys are ordered tile-major, so one tile is a contiguous
+# searchsorted slice. Zooms above MAX_ZOOM are answered with raw store
+# pixels.
+# --------------------------------------------
+
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+import backend.config as config
+from backend.response_cache import file_version
+
+MAX_LAT = 85.05112878
+FIELDS = ("count", "no2_sum", "no2_max", "anomalies")
+PYRAMID_FILE = "pyramid.npz"
+
+
+# === Web Mercator helpers ===
+
+def lonlat_to_global(lat, lon, zoom_bits):
+    """Integer global pixel coordinates (gx, gy) on a 2**zoom_bits grid."""
+    n = 1 << zoom_bits
+    lat = np.clip(np.asarray(lat, dtype=float), -MAX_LAT, MAX_LAT)
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.deg2rad(lat))) / np.pi) / 2.0
+    gx = np.clip((x * n).astype(np.int64), 0, n - 1)
+    gy = np.clip((y * n).astype(np.int64), 0, n - 1)
+    return gx, gy
+
+
+def global_to_lonlat(gx, gy, zoom_bits):
+    """Centre (lat, lon) of global pixels on a 2**zoom_bits grid."""
+    n = float(1 << zoom_bits)
+    lon = (np.asarray(gx) + 0.5) / n * 360.0 - 180.0
+    lat = np.rad2deg(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (np.asarray(gy) + 0.5) / n))))
+    return lat, lon
+
+
+def tile_bbox(z, x, y):
+    """(west, south, east, north) of an XYZ tile."""
+    n = float(1 << z)
+    west, east = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    north = np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    south = np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
+    return west, float(south), east, float(north)
+
+
+# === Bin keys (tile-major) ===
+
+def encode_keys(gx, gy, z, bin_bits):
+    mask = (1 << bin_bits) - 1
+    tile = ((gy >> bin_bits) << z) | (gx >> bin_bits)
+    return (tile << (2 * bin_bits)) | ((gy & mask) << bin_bits) | (gx & mask)
+
+
+def decode_keys(keys, z, bin_bits):
+    mask = (1 << bin_bits) - 1
+    tile = keys >> (2 * bin_bits)
+    tx, ty = tile & ((1 << z) - 1), tile >> z
+    gx = (tx << bin_bits) | (keys & mask)
+    gy = (ty << bin_bits) | ((keys >> bin_bits) & mask)
+    return gx, gy
+
+
+def reduce_bins(keys, count, no2_sum, no2_max, anomalies):
+    """Merge duplicate keys: sums add, maxima take the max. Output is key-sorted."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    n = len(uniq)
+    out_max = np.full(n, -np.inf)
+    np.maximum.at(out_max, inv, no2_max)
+    return {
+        "keys": uniq,
+        "count": np.bincount(inv, weights=count, minlength=n).astype(np.int64),
+        "no2_sum": np.bincount(inv, weights=no2_sum, minlength=n),
+        "no2_max": out_max,
+        "anomalies": np.bincount(inv, weights=anomalies, minlength=n).astype(np.int64),
+    }
+
+
+def bin_store(store, max_zoom, bin_bits, **predicates):
+    """Finest-level bins of every store pixel matching predicates (None if there are none)."""
+    parts = []
+    cols = [config.LAT_COL, config.LON_COL, config.NO2_COL, config.ANOM_COL]
+    for part in store.iter_parts(columns=cols, **predicates):
+        no2 = part[config.NO2_COL].to_numpy(dtype=float)
+        ok = np.isfinite(no2)
+        if not ok.any():
+            continue
+        gx, gy = lonlat_to_global(part[config.LAT_COL].to_numpy()[ok],
+                                  part[config.LON_COL].to_numpy()[ok], max_zoom + bin_bits)
+        anom = np.nan_to_num(part[config.ANOM_COL].to_numpy(dtype=float)[ok])
+        parts.append(reduce_bins(encode_keys(gx, gy, max_zoom, bin_bits),
+                                 np.ones(len(gx)), no2[ok], no2[ok], anom))
+    return merge_bins(parts)
+
+
+def merge_bins(parts):
+    """One reduce over many key-sorted bin sets (None if parts is empty)."""
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return reduce_bins(*(np.concatenate([p[k] for p in parts]) for k in ("keys",) + FIELDS))
+
+
+class TilePyramid:
+    """Per-zoom sparse bin aggregates of the fused store."""
+
+    def __init__(self, levels, max_zoom, bin_bits, version=None):
+        self.levels = levels            # {z: {"keys", "count", "no2_sum", "no2_max", "anomalies"}}
+        self.max_zoom = max_zoom
+        self.bin_bits = bin_bits
+        self.version = version
+
+    @classmethod
+    def from_bins(cls, bins, max_zoom, bin_bits, version=None):
+        """Finest-level bins at max_zoom, then 2x2 merges down to zoom 0."""
+        levels = {}
+        if bins is not None:
+            levels[max_zoom] = bins
+            for z in range(max_zoom - 1, -1, -1):
+                gx, gy = decode_keys(levels[z + 1]["keys"], z + 1, bin_bits)
+                fine = levels[z + 1]
+                levels[z] = reduce_bins(encode_keys(gx >> 1, gy >> 1, z, bin_bits),
+                                        *(fine[k] for k in FIELDS))
+        return cls(levels, max_zoom, bin_bits, version=version)
+
+    @classmethod
+    def build(cls, store, max_zoom=None, bin_bits=None, **predicates):
+        """One pass over the store (or the parts matching predicates), no persistence."""
+        max_zoom = config.TILE_MAX_ZOOM if max_zoom is None else max_zoom
+        bin_bits = bin_bits or config.TILE_BIN_BITS
+        return cls.from_bins(bin_store(store, max_zoom, bin_bits, **predicates), max_zoom, bin_bits)
+
+    # === Persistence ===
+
+    @classmethod
+    def cached(cls, cache_dir=None):
+        """The pyramid fusion last wrote (an empty one before the first refresh)."""
+        path = pyramid_path(cache_dir)
+        version = file_version(path)
+        if version is not None:
+            try:
+                return cls.load(path, version)
+            except (OSError, ValueError, KeyError):
+                pass  # replaced mid-read: the next call sees the new file
+        return cls({}, config.TILE_MAX_ZOOM, config.TILE_BIN_BITS, version=version)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {f"z{z}_{k}": v for z, level in self.levels.items() for k, v in level.items()}
+        arrays["meta"] = np.array([self.max_zoom, self.bin_bits])
+        tmp = f"{path}.tmp{os.getpid()}.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, version=None):
+        with np.load(path) as npz:
+            max_zoom, bin_bits = (int(v) for v in npz["meta"])
+            levels = {}
+            for name in npz.files:
+                if name == "meta":
+                    continue
+                z, key = name[1:].split("_", 1)
+                levels.setdefault(int(z), {})[key] = npz[name]
+        return cls(levels, max_zoom, bin_bits, version=version)
+
+    # === Queries ===
+
+    def tile(self, z, x, y):
+        """Binned aggregates of one tile at z <= max_zoom, as column lists."""
+        level = self.levels.get(z)
+        empty = {"lat": [], "lon": [], "count": [], "no2_mean": [], "no2_max": [], "anomalies": []}
+        if level is None:
+            return empty
+        tile_id = (y << z) | x
+        span = 2 * self.bin_bits
+        lo, hi = np.searchsorted(level["keys"], [tile_id << span, (tile_id + 1) << span])
+        if lo == hi:
+            return empty
+        sl = slice(lo, hi)
+        gx, gy = decode_keys(level["keys"][sl], z, self.bin_bits)
+        lat, lon = global_to_lonlat(gx, gy, z + self.bin_bits)
+        count = level["count"][sl]
+        return {
+            "lat": np.round(lat, 4).tolist(),
+            "lon": np.round(lon, 4).tolist(),
+            "count": count.tolist(),
+            "no2_mean": (level["no2_sum"][sl] / count).tolist(),
+            "no2_max": level["no2_max"][sl].tolist(),
+            "anomalies": level["anomalies"][sl].tolist(),
+        }
+
+
+def raw_tile(store, z, x, y, limit=None):
+    """Raw fused pixels inside a tile (fine zooms), read with bbox pushdown."""
+    limit = limit or config.TILE_RAW_LIMIT
+    cols = [config.LAT_COL, config.LON_COL, config.NO2_COL, config.ANOM_COL]
+    df = store.read(columns=cols, bbox=tile_bbox(z, x, y))
+    truncated = len(df) > limit
+    if truncated:
+        # Keep the strongest pixels rather than a random subset
+        df = df.nlargest(limit, config.NO2_COL)
+    points = {c: df[c].tolist() for c in cols}
+    return points, truncated
+
+
+# === Fusion-side refresh ===
+
+def pyramid_path(cache_dir=None):
+    return os.path.join(cache_dir or config.TILE_CACHE_DIR, PYRAMID_FILE)
+
+
+def _day_path(cache_dir, day):
+    return os.path.join(cache_dir, f"day={day}.npz")
+
+
+def refresh_pyramid(store, days=None, cache_dir=None, max_zoom=None, bin_bits=None):
+    """Re-bin the given store dates ("YYYY-MM-DD"; None = every date) and rewrite pyramid.npz.
+
+    Only those days' pixels are read; the pyramid is then merged from every day's
+    bins in one reduce. Superseded files in cache_dir are deleted.
+    """
+    cache_dir = cache_dir or config.TILE_CACHE_DIR
+    max_zoom = config.TILE_MAX_ZOOM if max_zoom is None else max_zoom
+    bin_bits = bin_bits or config.TILE_BIN_BITS
+    os.makedirs(cache_dir, exist_ok=True)
+    stored = sorted(os.path.basename(d)[len("date="):] for d in glob(os.path.join(store.root, "date=*")))
+    stored = [d for d in stored if d != "undated"]
+    for day in (stored if days is None else days):
+        start = pd.Timestamp(day)
+        bins = bin_store(store, max_zoom, bin_bits,
+                         start=start, end=start + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
+        path = _day_path(cache_dir, day)
+        if bins is None:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        tmp = f"{path}.tmp{os.getpid()}.npz"
+        np.savez(tmp, **bins)
+        os.replace(tmp, path)
+
+    keep = {pyramid_path(cache_dir)}
+    parts = []
+    for day in stored:
+        path = _day_path(cache_dir, day)
+        if os.path.exists(path):
+            keep.add(path)
+            with np.load(path) as npz:
+                parts.append({k: npz[k] for k in ("keys",) + FIELDS})
+    pyramid = TilePyramid.from_bins(merge_bins(parts), max_zoom, bin_bits)
+    pyramid.save(pyramid_path(cache_dir))
+    for path in glob(os.path.join(cache_dir, "*.npz")):
+        if path not in keep:
+            os.remove(path)  # days no longer in the store, version-keyed pyramids
+    return pyramid
+
+
+if __name__ == "__main__":
+    from backend.fused_store import FusedStore
+    levels = refresh_pyramid(FusedStore()).levels
+    print(f"✅ Tile pyramid rebuilt: {len(levels)} zoom levels")
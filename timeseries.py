@@ -0,0 +1,257 @@
+# timeseries.py
+# --------------------------------------------
+# Per-cell NO2 time series for ADIS
+# Fused pixels are reduced per granule to per-cell records (time, pixel
+# count, NO2 mean / max, anomaly count) on a TS_CELL_DEG grid. Records
+# are chunked by day and by spatial block of TS_BLOCK_CELLS x
+# TS_BLOCK_CELLS cells:
+#   <root>/day=YYYY-MM-DD/block=RRRR_CCCC.npz
+# Inside a chunk, records are sorted by (cell, time) with a per-cell
+# offsets array, so one cell's history over a range is one slice per day
+# in that range. The cost does not depend on how many granules exist.
+# Fusion calls record() for each granule it writes, so the series are
+# kept current in the write path and queries only read chunks. sync()
+# backfills from an existing store: only granules whose store parts
+# changed are re-reduced, and each one replaces its own records.
+# --------------------------------------------
+
+import json
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+import backend.config as config
+from backend.climatology import CellGrid
+from backend.fused_store import META_FILE
+
+LEDGER_FILE = "ledger.json"
+FIELDS = ("time", "pixels", "no2_mean", "no2_max", "anomalies")
+
+
+def _iso(ts):
+    return pd.Timestamp(ts).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def granule_records(grid, df):
+    """Per-cell (ids, pixels, no2_mean, no2_max, anomalies) of one granule's pixels."""
+    no2 = df[config.NO2_COL].to_numpy(dtype=np.float64)
+    ids = grid.cell_ids(df[config.LAT_COL].to_numpy(), df[config.LON_COL].to_numpy())
+    ok = (ids >= 0) & np.isfinite(no2)
+    ids, no2 = ids[ok], no2[ok]
+    flags = df[config.ANOM_COL].to_numpy()[ok] == 1 if config.ANOM_COL in df.columns else np.zeros(len(ids), bool)
+    uniq, inv = np.unique(ids, return_inverse=True)
+    k = len(uniq)
+    pixels = np.bincount(inv, minlength=k)
+    no2_max = np.full(k, -np.inf)
+    np.maximum.at(no2_max, inv, no2)
+    return (uniq, pixels, np.bincount(inv, weights=no2, minlength=k) / np.maximum(pixels, 1),
+            no2_max, np.bincount(inv, weights=flags, minlength=k))
+
+
+class TimeSeriesStore:
+    """Day x spatial-block chunked per-cell series, synced from a FusedStore."""
+
+    def __init__(self, root=None, cell_deg=None, bounds=None, block_cells=None):
+        self.root = root or config.TIMESERIES_DIR
+        os.makedirs(self.root, exist_ok=True)
+        self.ledger_path = os.path.join(self.root, LEDGER_FILE)
+        self.ledger = self._load_ledger()
+        grid_meta = self.ledger.get("grid")
+        if grid_meta:
+            cell_deg, bounds, block_cells = grid_meta["cell_deg"], grid_meta["bounds"], grid_meta["block_cells"]
+        self.grid = CellGrid(cell_deg or config.TS_CELL_DEG, bounds)
+        self.block = block_cells or config.TS_BLOCK_CELLS
+        self.ledger["grid"] = {"cell_deg": self.grid.cell_deg, "bounds": list(self.grid.bounds),
+                               "block_cells": self.block}
+
+    def _load_ledger(self):
+        if not os.path.exists(self.ledger_path):
+            return {"granules": {}}
+        with open(self.ledger_path, "r") as f:
+            return json.load(f)
+
+    def _save_ledger(self):
+        tmp = f"{self.ledger_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.ledger, f)
+        os.replace(tmp, self.ledger_path)
+
+    # === Chunk addressing ===
+
+    def locate(self, ids):
+        """(block row, block col, cell index inside the block) per flat cell id."""
+        row, col = np.divmod(np.asarray(ids, dtype=np.int64), self.grid.ncols)
+        local = (row % self.block) * self.block + (col % self.block)
+        return row // self.block, col // self.block, local
+
+    @staticmethod
+    def block_name(brow, bcol):
+        return f"{int(brow):04d}_{int(bcol):04d}"
+
+    def _chunk_path(self, day, block):
+        return os.path.join(self.root, f"day={day}", f"block={block}.npz")
+
+    def _read_chunk(self, path):
+        if not os.path.exists(path):
+            empty = {key: np.zeros(0, dtype=np.int64) for key in ("cell", "time", "pixels", "anomalies")}
+            empty.update(no2_mean=np.zeros(0), no2_max=np.zeros(0))
+            return empty
+        with np.load(path) as z:
+            return {key: z[key] for key in ("cell",) + FIELDS}
+
+    def _write_chunk(self, path, records):
+        if not len(records["cell"]):
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        order = np.lexsort((records["time"], records["cell"]))
+        records = {key: values[order] for key, values in records.items()}
+        offsets = np.searchsorted(records["cell"], np.arange(self.block * self.block + 1))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}.npz"
+        np.savez(tmp, offsets=offsets, **records)
+        os.replace(tmp, path)
+
+    # === Updates ===
+
+    def _replace(self, stamp, blocks_before, records=None):
+        """Drop `stamp` records from its chunks and add the new ones. Returns the blocks touched."""
+        day, t = stamp[:10], pd.Timestamp(stamp).value
+        new = {}
+        if records is not None:
+            ids, pixels, mean, peak, anomalies = records
+            brow, bcol, local = self.locate(ids)
+            key = brow * (self.grid.ncols // self.block + 1) + bcol
+            order = np.argsort(key, kind="stable")
+            bounds = np.flatnonzero(np.r_[True, key[order][1:] != key[order][:-1], True])
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                m = order[a:b]
+                new[self.block_name(brow[m[0]], bcol[m[0]])] = {
+                    "cell": local[m], "time": np.full(len(m), t, dtype=np.int64),
+                    "pixels": pixels[m].astype(np.int64), "no2_mean": mean[m],
+                    "no2_max": peak[m], "anomalies": anomalies[m].astype(np.int64)}
+        for name in set(blocks_before) | set(new):
+            path = self._chunk_path(day, name)
+            chunk = self._read_chunk(path)
+            keep = chunk["time"] != t
+            chunk = {key: values[keep] for key, values in chunk.items()}
+            if name in new:
+                chunk = {key: np.concatenate([chunk[key], new[name][key]]) for key in chunk}
+            self._write_chunk(path, chunk)
+        return sorted(new)
+
+    @staticmethod
+    def _signature(path):
+        """[rows, _meta.json mtime] of a store part: changes whenever the part is rewritten."""
+        meta_path = os.path.join(path, META_FILE)
+        with open(meta_path, "r") as f:
+            rows = json.load(f)["rows"]
+        return [rows, os.stat(meta_path).st_mtime_ns]
+
+    def record(self, store, time, parts):
+        """Re-reduce one granule just written to the store as `parts` (empty: drop it)."""
+        stamp = _iso(time)
+        seen = self.ledger["granules"].pop(stamp, None)
+        blocks_before = seen["blocks"] if seen else []
+        if parts:
+            columns = [config.LAT_COL, config.LON_COL, config.NO2_COL, config.ANOM_COL]
+            df = store.read(columns=columns, start=stamp, end=stamp)
+            blocks = self._replace(stamp, blocks_before, granule_records(self.grid, df))
+            self.ledger["granules"][stamp] = {"parts": {p: self._signature(p) for p in parts},
+                                              "blocks": blocks}
+        else:
+            self._replace(stamp, blocks_before)
+        self._save_ledger()
+
+    def sync(self, store):
+        """Re-reduce every granule whose store parts changed; drop granules that vanished.
+
+        A full pass over the store's partitions, for backfilling; fusion keeps the
+        series current with record(). Parts are grouped by their granule time (one
+        time per part, as fusion writes them). Returns the number of granules updated.
+        """
+        current = {}
+        for path, meta in store.partitions():
+            if "time" not in meta:
+                continue
+            stamp = _iso(meta["time"][0])
+            stat = os.stat(os.path.join(path, META_FILE))
+            current.setdefault(stamp, {})[path] = [meta["rows"], stat.st_mtime_ns]
+
+        granules = self.ledger["granules"]
+        changed = 0
+        for stamp in sorted(set(granules) - set(current)):
+            self._replace(stamp, granules.pop(stamp)["blocks"])
+            changed += 1
+        columns = [config.LAT_COL, config.LON_COL, config.NO2_COL, config.ANOM_COL]
+        for stamp, parts in sorted(current.items()):
+            seen = granules.get(stamp)
+            if seen is not None and seen["parts"] == parts:
+                continue
+            df = store.read(columns=columns, start=stamp, end=stamp)
+            blocks = self._replace(stamp, seen["blocks"] if seen else [], granule_records(self.grid, df))
+            granules[stamp] = {"parts": parts, "blocks": blocks}
+            self._save_ledger()
+            changed += 1
+        self._save_ledger()
+        return changed
+
+    # === Queries ===
+
+    def series(self, lat, lon, start=None, end=None):
+        """History of the cell containing (lat, lon) as a time-sorted DataFrame."""
+        cell = int(self.grid.cell_ids([lat], [lon])[0])
+        columns = list(FIELDS)
+        if cell < 0:
+            return pd.DataFrame(columns=columns)
+        (brow,), (bcol,), (local,) = self.locate([cell])
+        name = self.block_name(brow, bcol)
+        start = pd.Timestamp(start).tz_localize(None) if start is not None else None
+        end = pd.Timestamp(end).tz_localize(None) if end is not None else None
+        if start is not None and end is not None:
+            # Only the days in range are visited, however long the archive is
+            days = [d.strftime("%Y-%m-%d") for d in pd.date_range(start.normalize(), end.normalize(), freq="D")]
+        else:
+            days = sorted(os.path.basename(d)[len("day="):] for d in glob(os.path.join(self.root, "day=*")))
+        if start is not None:
+            days = [d for d in days if d >= start.strftime("%Y-%m-%d")]
+        if end is not None:
+            days = [d for d in days if d <= end.strftime("%Y-%m-%d")]
+
+        parts = []
+        for day in days:
+            path = self._chunk_path(day, name)
+            if not os.path.exists(path):
+                continue
+            with np.load(path) as z:
+                a, b = z["offsets"][local], z["offsets"][local + 1]
+                if b > a:
+                    parts.append({key: z[key][a:b] for key in FIELDS})
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame({key: np.concatenate([p[key] for p in parts]) for key in FIELDS})
+        df["time"] = pd.to_datetime(df["time"])
+        if start is not None:
+            df = df[df["time"] >= start]
+        if end is not None:
+            df = df[df["time"] <= end]
+        return df.sort_values("time").reset_index(drop=True)
+
+    def cell_bounds(self, lat, lon):
+        """(west, south, east, north) of the cell containing (lat, lon), or None outside the grid."""
+        cell = int(self.grid.cell_ids([lat], [lon])[0])
+        if cell < 0:
+            return None
+        row, col = divmod(cell, self.grid.ncols)
+        west, south = self.grid.bounds[0], self.grid.bounds[1]
+        d = self.grid.cell_deg
+        return tuple(round(v, 6) for v in (west + col * d, south + row * d,
+                                            west + (col + 1) * d, south + (row + 1) * d))
+
+
+if __name__ == "__main__":
+    from backend.fused_store import FusedStore
+    updated = TimeSeriesStore().sync(FusedStore())
+    print(f"✅ Time series synced: {updated} granules updated")
@@ -4,9 +4,14 @@
 # Shared helpers used by detection, fusion, and plume modules
 # --------------------------------------------
 
+import os
+import re
+
 import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timezone
+
+import backend.config as config
 
 # === Coordinate and distance helpers ===
 
@@ -26,6 +31,17 @@ def normalize_angle(angle):
     return ((angle + 180) % 360) - 180
 
 
+# === Unit helpers ===
+
+def no2_column_to_ppb(column, pbl_height_m=None):
+    """Crude surface NO2 (ppb) from a tropospheric column (molecules/cm²).
+
+    Assumes the column is well mixed through a boundary layer of pbl_height_m.
+    """
+    pbl_cm = (pbl_height_m or config.NO2_PBL_HEIGHT_M) * 100.0
+    return np.asarray(column, dtype=float) / (pbl_cm * config.AIR_NUMBER_DENSITY) * 1e9
+
+
 # === Data cleaning and processing ===
 
 def clean_dataset(df, required_cols):
@@ -61,10 +77,27 @@ def format_datetime(ts):
     return str(ts)
 
 
+_GRANULE_TIME_RE = re.compile(r"(\d{8}T\d{6})Z")
+
+
+def parse_granule_time(path):
+    """Extract the UTC start time from a TEMPO file name (e.g. ..._20250406T215103Z_S012G07.nc)."""
+    match = _GRANULE_TIME_RE.search(os.path.basename(str(path)))
+    if not match:
+        raise ValueError(f"No granule timestamp in file name: {path}")
+    return datetime.strptime(match.group(1), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+
+
 # === Geo-matching ===
 
-def nearest_point(lat, lon, df, lat_col="lat", lon_col="lon"):
-    """Find nearest point in df to given (lat, lon)."""
+def nearest_point(lat, lon, df, lat_col="lat", lon_col="lon", index=None):
+    """Find nearest point in df to given (lat, lon).
+
+    Pass a spatial_index.SphericalIndex built over df's coordinates to skip the O(N) scan.
+    """
+    if index is not None:
+        dist, idx = index.query([lat], [lon], k=1)
+        return df.iloc[int(idx[0])], float(dist[0])
     distances = haversine(lat, lon, df[lat_col].values, df[lon_col].values)
     idx = np.argmin(distances)
     return df.iloc[idx], distances[idx]
@@ -0,0 +1,120 @@
+# wind_field.py
+# --------------------------------------------
+# Gridded, time-varying MERRA-2 winds for ADIS plume advection
+# U/V are pulled out of the inst1_2d_asm_Nx file once, written as .npy
+# (time, lat, lon) float32 arrays under WIND_CACHE_DIR and memory-mapped
+# from then on. Particles are sampled with bilinear interpolation in
+# space (regrid.sample_grid) and linear interpolation in time.
+# --------------------------------------------
+
+import hashlib
+import json
+import os
+import threading
+from datetime import timezone
+
+import numpy as np
+
+import backend.config as config
+from backend.regrid import grid_axes, sample_grid
+
+WIND_VAR_PAIRS = [("U10M", "V10M"), ("U2M", "V2M"), ("U50M", "V50M")]
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class WindField:
+    """Memory-mapped (time, lat, lon) U/V fields on a regular MERRA-2 grid."""
+
+    def __init__(self, u, v, times, axes, variables):
+        self.u = u                      # (T, lat, lon), m/s
+        self.v = v
+        self.times = np.asarray(times, dtype="datetime64[s]")
+        self.axes = tuple(axes)         # regrid.grid_axes tuple
+        self.variables = variables
+
+    # === Loading ===
+
+    @classmethod
+    def from_merra(cls, path, cache_dir=None):
+        """Extract U/V from a MERRA-2 file into the .npy cache and memory-map them."""
+        import xarray as xr
+
+        cache_dir = cache_dir or config.WIND_CACHE_DIR
+        key = _cache_key(path)
+        base = os.path.join(cache_dir, key)
+        if not os.path.exists(f"{base}.json"):
+            with xr.open_dataset(path) as ds:
+                pair = next((p for p in WIND_VAR_PAIRS if p[0] in ds and p[1] in ds), None)
+                if pair is None:
+                    raise KeyError(f"No U/V wind variables in {path}")
+                os.makedirs(cache_dir, exist_ok=True)
+                for name, var in zip(("u", "v"), pair):
+                    arr = ds[var].transpose("time", "lat", "lon").values.astype(np.float32)
+                    np.save(f"{base}.{name}.tmp.npy", arr)
+                    os.replace(f"{base}.{name}.tmp.npy", f"{base}.{name}.npy")
+                meta = {
+                    "variables": list(pair),
+                    "axes": [float(a) for a in grid_axes(ds)],
+                    "times": [str(t) for t in ds["time"].values.astype("datetime64[s]")],
+                }
+            with open(f"{base}.json.tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(f"{base}.json.tmp", f"{base}.json")
+
+        with open(f"{base}.json", "r") as f:
+            meta = json.load(f)
+        lat0, dlat, nlat, lon0, dlon, nlon = meta["axes"]
+        return cls(np.load(f"{base}.u.npy", mmap_mode="r"), np.load(f"{base}.v.npy", mmap_mode="r"),
+                   np.array(meta["times"], dtype="datetime64[s]"),
+                   (lat0, dlat, int(nlat), lon0, dlon, int(nlon)), meta["variables"])
+
+    @classmethod
+    def cached(cls, path, cache_dir=None):
+        """Process-wide WindField for path, reloaded only if the file changes."""
+        key = _cache_key(path)
+        with _loaded_lock:
+            field = _loaded.get(path)
+            if field is None or field[0] != key:
+                field = (key, cls.from_merra(path, cache_dir))
+                _loaded[path] = field
+        return field[1]
+
+    # === Sampling ===
+
+    def sample(self, lat, lon, when):
+        """(u, v) at each point at one time (datetime64); times outside the file are clamped."""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        t = (np.datetime64(when, "s") - self.times[0]) / np.timedelta64(1, "s")
+        step = (self.times[1] - self.times[0]) / np.timedelta64(1, "s") if len(self.times) > 1 else 1.0
+        ft = float(np.clip(t / step, 0, len(self.times) - 1))
+        i0 = int(np.floor(ft))
+        i1 = min(i0 + 1, len(self.times) - 1)
+        w = ft - i0
+
+        flat_lat, flat_lon = lat.ravel(), lon.ravel()
+        out = []
+        for field in (self.u, self.v):
+            val = sample_grid(field[i0], flat_lat, flat_lon, self.axes)
+            if w > 0:
+                val = (1 - w) * val + w * sample_grid(field[i1], flat_lat, flat_lon, self.axes)
+            out.append(np.nan_to_num(val).reshape(lat.shape))
+        return out[0], out[1]
+
+    def provider(self, start):
+        """wind(lat, lon, t_sec) callable for plume.simulate_particles, t_sec after start."""
+        if getattr(start, "tzinfo", None) is not None:
+            start = start.astimezone(timezone.utc).replace(tzinfo=None)
+        start = np.datetime64(start, "s")
+
+        def wind(lat, lon, t_sec):
+            return self.sample(lat, lon, start + np.timedelta64(int(round(t_sec)), "s"))
+        return wind